@@ -8,29 +8,45 @@ Analysis module for R&S FSVR Signal Analyzer DAT files
 
 April 2017
 """
-import matplotlib.pyplot as plt
 import numpy as np
 import warnings
 import csv
+import os
+from contextlib import nullcontext
+from FSVRStatistics import FSVRStatistics
+from FSVRProfiler import FSVRProfiler
+from FSVREvents import FSVREvents
+from FSVRFrame import FSVRFrame
+from FSVRPyramid import FSVRPyramid
 
 
 class FSVRAnalysis:
     """
-    Module for analysis basically channel occupation
+    Module for analysis basically channel occupation. All state is kept per object, analyzers of different
+    readers can run in parallel threads
     """
     reader = None  #: object: dump file reader object from external class
     info_initialized = False #: bool: flag that get_info() method was executed
     threshold = 0.0  #: float: threshold level for analysis
-    filter_mask = []  #: list: which frequencies will be used for analysis
+    filter_mask = None  #: list: which frequencies will be used for analysis
     data_points = 0  #: int: number of points to be analysed
+    frame_start = 0  #: int: position of the first analysed data frame
+    frame_step = 1  #: int: every frame_step-th data frame is analysed
     f_span = 0.0  #: float: frequency span
     f_resolution = 0.0 #: float: frequency resolution
     freq = 0.0  #: float: central frequency
     start_ts = 0.0  #: float: start timestamp
     end_ts = 0.0  #: float: end timestamp
     duration = 0.0  #: float: sample duration from the first to the last data frame
-    timeline = []
-    thresholds = []
+    timeline = None  #: numpy.ndarray: time of the analysed data frames from the start
+    thresholds = None  #: list: sorted threshold levels of the Markov states
+    matrix = None  #: dict: cached frame matrix of the analysed data frames
+    matrix_key = None  #: tuple: file, its signature, number of data points and decimation of the cached matrix
+    profiler = None  #: FSVRProfiler: timers and counters of the analysis stages, shared with the reader
+    bands = None  #: dict: named frequency bands {name: (start frequency, stop frequency)}
+    headless = False  #: bool: render figures on Figure/Agg objects without pyplot, figures can only be saved
+    plot_points = 2000  #: int: maximal number of drawn points of a series, longer series are min/max decimated
+    pyramid = None  #: FSVRPyramid: level pyramid of the file used by waterfall plots
 
     @property
     def get_threshold(self):
@@ -93,17 +109,55 @@ class FSVRAnalysis:
         else:
             self.data_points = int(self.reader.get_data_frames_amount())
             warnings.warn("Only " + str(self.data_points) + " data frame(s) are available, was set to this")
+        self.invalidate_cache()
+
+    def set_decimation(self, step, start=0):
+        """
+        Selects every step-th data frame from start up to the number of data points for the analysis,
+        e.g. for quick previews of long captures, frames in between are not converted by readers with iter_frames()
+        :param step: int: distance between analysed data frames
+        :param start: int: position of the first analysed data frame
+        :return: 
+        """
+        if step < 1:
+            raise ValueError("Step must be a positive number")
+        self.frame_step = step
+        self.frame_start = max(start, 0)
+        self.invalidate_cache()
+
+    def is_decimated(self):
+        """
+        :return: bool: True if only a part of the data frames is analysed
+        """
+        return self.frame_step > 1 or self.frame_start > 0
+
+    def invalidate_cache(self):
+        """
+        Drops cached frame matrix, next analysis will read the file again
+        :return: 
+        """
+        self.matrix = None
+        self.matrix_key = None
 
     @staticmethod
-    def init_plot(xlabel="", ylabel="", title=""):
+    def init_plot(xlabel="", ylabel="", title="", headless=False):
         """
         Prepares objects to plot
         :param xlabel: label on x axis
         :param ylabel: label on y axis
         :param title: title above the plot
+        :param headless: bool: use Figure with Agg canvas which is not registered in pyplot
         :return: fig, ax - figure object to process to finish_plot() method
         """
-        fig = plt.figure()
+        if headless:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            fig = Figure()
+            FigureCanvasAgg(fig)
+        else:
+            # pyplot is imported on the first plot only, numeric analysis does not load it
+            import matplotlib.pyplot as plt
+            fig = plt.figure()
         # set title
         fig.suptitle(title, fontsize=14, fontweight='bold')
         ax = fig.add_subplot(111)
@@ -116,7 +170,7 @@ class FSVRAnalysis:
     @staticmethod
     def finish_plot(fig, ax, filename=None, legend=None):
         """
-        Finishes plotting the figure
+        Finishes plotting the figure, pyplot figures are closed after they are shown or saved
         :param fig: object from init_plot method
         :param ax: object from init_plot method
         :param filename: filename to save figure
@@ -135,11 +189,117 @@ class FSVRAnalysis:
             legendy = axis.get_ylim()[0] + 0.06 * yr  # axis.get_ylim()[1] - 0.06 * yr * (legend.count("\n") if legend.count("\n") > 1 else 1)
             ax.text(legendx, legendy,
                     legend, bbox={'facecolor': 'white', 'alpha': 0.7, 'pad': 5})
-        if filename is None:
+        # headless figures are not managed by pyplot and can not be shown
+        managed = getattr(fig.canvas, 'manager', None) is not None
+        if managed:
+            import matplotlib.pyplot as plt
+        if filename is None and managed:
             plt.show()
+        elif filename is not None:
+            fig.savefig(filename)
+        if managed:
+            plt.close(fig)
+
+    @staticmethod
+    def get_decimation_index(values, points):
+        """
+        Selects points of a long series to draw, the series is split into points/2 buckets
+        and the minimum and the maximum of every bucket are kept, so peaks stay visible
+        :param values: list: series values
+        :param points: int: maximal number of selected points
+        :return: numpy.ndarray: sorted indices of the selected points
+        """
+        values = np.asarray(values, dtype=np.float64)
+        count = len(values)
+        buckets = max(points // 2, 1)
+        if count <= max(points, 2):
+            return np.arange(count)
+        size = -(-count // buckets)
+        buckets = -(-count // size)
+        # the last bucket is padded with its last value
+        padded = np.concatenate((values, np.full(buckets * size - count, values[-1]))).reshape(buckets, size)
+        offsets = np.arange(buckets) * size
+        index = np.concatenate((offsets + np.argmin(padded, axis=1), offsets + np.argmax(padded, axis=1)))
+        return np.unique(np.minimum(index, count - 1))
+
+    def load_matrix(self):
+        """
+        Loads data frames selected by data_points into a level matrix, the matrix is read once
+        and cached until the file, its size or modification time or number of data points changes
+        :return: dict: frame matrix {'Frequency': array of frequencies, 'Data': frames x values array of levels,
+                 'Timestamp': array of timestamps, 'Frame': array of frame numbers}
+        """
+        # if number of data points is not set
+        if self.get_data_points <= 0:
+            self.set_data_points(0)
+        filename = self.reader.get_filename()
+        # a rewritten or appended file changes its size or modification time and is read again
+        status = os.stat(filename) if os.path.isfile(filename) else None
+        signature = (status.st_size, status.st_mtime_ns) if status is not None else None
+        key = (filename, signature, self.data_points, self.frame_start, self.frame_step)
+        if self.matrix is None or self.matrix_key != key:
+            self.profiler.count('matrix_loads')
+            with self.profiler.stage('load_matrix'):
+                self.matrix = self.read_matrix()
+            self.matrix_key = key
         else:
-            plt.savefig(filename)
+            self.profiler.count('matrix_cache_hits')
+        return self.matrix
+
+    def read_matrix(self):
+        """
+        Reads data frames selected by data_points and decimation from the reader bypassing the cache
+        :return: dict: frame matrix, see load_matrix()
+        """
+        if hasattr(self.reader, 'read_matrix') and not self.is_decimated():
+            return self.reader.read_matrix(0, self.data_points)
+        levels = []
+        timestamps = []
+        frames = []
+        frequency = []
+        with self.lock_reader():
+            for i, frame in enumerate(self.iter_frames()):
+                # levels of FSVRFrame objects are stacked as they are, other frames are dictionaries
+                if isinstance(frame, FSVRFrame):
+                    if i == 0:
+                        frequency = frame.frequency
+                    levels.append(frame.levels)
+                else:
+                    if i == 0:
+                        frequency = list(frame['Data'].keys())
+                    levels.append(list(frame['Data'].values()))
+                timestamps.append(frame['Timestamp'])
+                frames.append(int(frame['Frame']))
+        return {'Frequency': np.array(frequency, dtype=np.float64),
+                'Data': np.array(levels, dtype=np.float64).reshape(len(levels), len(frequency)),
+                'Timestamp': np.array(timestamps, dtype=np.float64), 'Frame': np.array(frames, dtype=np.int64)}
+
+    def lock_reader(self):
+        """
+        :return: context manager holding the lock of the reader while a pass moves its file pointer,
+                 readers without a lock are not locked
+        """
+        lock = getattr(self.reader, 'lock', None)
+        return nullcontext() if lock is None else lock
+
+    def iter_frames(self):
+        """
+        Yields data frames selected by data_points and decimation one by one,
+        readers without iter_frames() read all frames up to data_points.
+        The iteration moves the file pointer of the reader, hold lock_reader() if the reader is shared
+        :return: generator: frames as returned by get_last_frame() of the reader
+        """
+        if hasattr(self.reader, 'iter_frames'):
+            yield from self.reader.iter_frames(self.frame_start, self.data_points, self.frame_step)
+            return
+        # fallback for readers which provide only frame by frame interface
+        self.reader.reopen_file()
+        for i in range(self.data_points):
+            self.reader.read_frame()
+            if i >= self.frame_start and (i - self.frame_start) % self.frame_step == 0:
+                yield self.reader.get_last_frame()
 
+    @FSVRProfiler.timed('get_info')
     def get_info(self):
         """
         Calculates basic info, start and end timestamp, sample duration,
@@ -147,31 +307,25 @@ class FSVRAnalysis:
         :return: bool: True if successful, False otherwise.
         """
         self.info_initialized = True
-        # start from the 0 frame
-        self.reader.reopen_file()
+        matrix = self.load_matrix()
         # start and end timestamp
         self.start_ts = 0
         self.end_ts = 0
-        # if number of data points is not set
-        if self.get_data_points <= 0:
-            self.set_data_points(0)
-        # go though the data points
-        for i in range(self.data_points):
-            self.reader.read_frame()
-            if i == 0:
-                self.end_ts = self.reader.get_last_frame()['Timestamp']
-                # get frequency boundaries
-                keys = list(self.reader.get_last_frame()['Data'].keys())
-                self.freq = keys[int(round(len(keys)/2,0))]
-                self.f_span = abs(keys[0] - keys[len(keys)-1])
-                self.f_resolution = abs(keys[1] - keys[0])
-            elif i == self.data_points-1:
-                self.start_ts = self.reader.get_last_frame()['Timestamp']
+        if len(matrix['Timestamp']) > 0:
+            self.end_ts = matrix['Timestamp'][0]
+            # get frequency boundaries
+            keys = matrix['Frequency'].tolist()
+            self.freq = keys[int(round(len(keys)/2,0))]
+            self.f_span = abs(keys[0] - keys[len(keys)-1])
+            self.f_resolution = abs(keys[1] - keys[0])
+        if len(matrix['Timestamp']) > 1:
+            self.start_ts = matrix['Timestamp'][-1]
         self.duration = round(self.end_ts - self.start_ts,3)
-        self.timeline = np.linspace(0, self.duration, self.data_points)
+        self.timeline = np.linspace(0, self.duration, len(matrix['Timestamp']))
         self.info_initialized = True
         return self.info_initialized
 
+    @FSVRProfiler.timed('filtering_statistic_analyze')
     def filtering_statistic_analyze(self):
         """
         Evaluates filtered values of data frames over time
@@ -182,18 +336,139 @@ class FSVRAnalysis:
             return False
         if not self.info_initialized:
             self.get_info()
-        result = []
-        # go though the data points
-        for i in range(self.data_points):
-            self.reader.read_frame()
-            # calculate average value over filtered frequencies
-            avg = 0
-            for filter_val in self.filter_mask:
-                avg += self.reader.get_last_frame()['Data'][filter_val]
-            avg = avg / len(self.filter_mask)
-            result.append(avg)
-        return result
+        matrix = self.load_matrix()
+        # columns of the filtered frequencies
+        columns = {f: i for i, f in enumerate(matrix['Frequency'].tolist())}
+        mask = [columns[filter_val] for filter_val in self.filter_mask]
+        # calculate average value over filtered frequencies
+        return (matrix['Data'][:, mask].sum(axis=1) / len(self.filter_mask)).tolist()
+
+    def set_bands(self, bands):
+        """
+        Sets named frequency bands for band_statistic_analyze()
+        :param bands: dict: {name: (start frequency, stop frequency)} or {name: {'center': f, 'width': w}}
+        :return: 
+        """
+        self.bands = {}
+        for name, band in bands.items():
+            if isinstance(band, dict):
+                band = (band['center'] - band['width'] / 2, band['center'] + band['width'] / 2)
+            self.bands[name] = (min(band), max(band))
+
+    def get_band_columns(self, frequency):
+        """
+        Resolves frequency bands to columns of the frequency axis, bands include their boundaries
+        :param frequency: numpy.ndarray: frequency axis
+        :return: dict: {name: (first column, column after the last one)}
+        """
+        if self.bands is None:
+            raise RuntimeError("Frequency bands have not been set, run set_bands first")
+        if np.any(np.diff(frequency) < 0):
+            raise RuntimeError("Frequency axis must be ascending")
+        columns = {}
+        for name, (f_start, f_stop) in self.bands.items():
+            columns[name] = (int(np.searchsorted(frequency, f_start, side='left')),
+                             int(np.searchsorted(frequency, f_stop, side='right')))
+            if columns[name][0] >= columns[name][1]:
+                warnings.warn("Band " + str(name) + " does not contain any frequency")
+        return columns
+
+    @FSVRProfiler.timed('band_statistic_analyze')
+    def band_statistic_analyze(self, linear=False, block_size=4096):
+        """
+        Evaluates average level of every frequency band over time in one pass per block of frames
+        :param linear: bool: average power in the linear domain (mW) instead of averaging levels in dB
+        :param block_size: int: number of frames processed at once
+        :return: dict: {name: numpy.ndarray of averaged levels per data frame}
+        """
+        if not self.info_initialized:
+            self.get_info()
+        matrix = self.load_matrix()
+        columns = self.get_band_columns(matrix['Frequency'])
+        names = list(columns.keys())
+        starts = np.array([columns[name][0] for name in names], dtype=np.int64)
+        stops = np.array([columns[name][1] for name in names], dtype=np.int64)
+        widths = stops - starts
+        result = np.empty((len(matrix['Data']), len(names)))
+        for first in range(0, len(matrix['Data']), block_size):
+            block = np.asarray(matrix['Data'][first:first + block_size], dtype=np.float64)
+            if linear:
+                block = 10 ** (block / 10)
+            # band sums are differences of the cumulative sum over frequencies
+            cumsum = np.zeros((len(block), block.shape[1] + 1))
+            np.cumsum(block, axis=1, out=cumsum[:, 1:])
+            with np.errstate(invalid='ignore', divide='ignore'):
+                averages = (cumsum[:, stops] - cumsum[:, starts]) / widths
+                result[first:first + block_size] = 10 * np.log10(averages) if linear else averages
+        result[:, widths == 0] = np.nan
+        return {name: result[:, i] for i, name in enumerate(names)}
+
+    @staticmethod
+    def get_run_lengths(states):
+        """
+        Calculates lengths of runs of equal values
+        :param states: numpy.ndarray: bool series
+        :return: numpy.ndarray: lengths of True runs
+                 numpy.ndarray: lengths of False runs
+        """
+        states = np.asarray(states, dtype=bool)
+        if len(states) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        starts = np.concatenate(([0], np.flatnonzero(states[1:] != states[:-1]) + 1))
+        lengths = np.diff(np.concatenate((starts, [len(states)])))
+        return lengths[states[starts]], lengths[~states[starts]]
+
+    @FSVRProfiler.timed('occupancy')
+    def occupancy(self, threshold=None, window=None, stride=None, band=None, block_size=4096):
+        """
+        Thresholds every level of the data frames and calculates occupancy per frequency bin,
+        occupancy over sliding windows of frames and channel busy and idle periods
+        :param threshold: float: threshold level, current threshold if None
+        :param window: int: sliding window length in data frames, no sliding windows if None
+        :param stride: int: distance between window starts in data frames, window length if None
+        :param band: str: name of a band set by set_bands() used as the channel, all frequencies if None
+        :param block_size: int: number of frames processed at once
+        :return: dict: {'duty_cycle': share of frames over the threshold per bin,
+                 'window_start': first frame of each window, 'window_timestamp': timestamp of the first frame,
+                 'windowed': windows x bins share of frames over the threshold,
+                 'channel_busy': bool per frame, channel is busy when any of its bins is over the threshold,
+                 'busy_runs': lengths of busy periods in frames, 'idle_runs': lengths of idle periods in frames}
+        """
+        if threshold is None:
+            threshold = self.threshold
+        if not self.info_initialized:
+            self.get_info()
+        matrix = self.load_matrix()
+        n_frames, n_bins = matrix['Data'].shape
+        first, last = (0, n_bins) if band is None else self.get_band_columns(matrix['Frequency'])[band]
+        if window is not None:
+            stride = stride or window
+            window_start = np.arange(0, max(n_frames - window + 1, 0), stride)
+        else:
+            window_start = np.empty(0, dtype=np.int64)
+        # cumulative busy counts are needed only at the window boundaries
+        boundaries = np.unique(np.concatenate((window_start, window_start + (window or 0))))
+        cumulative = np.zeros((len(boundaries), n_bins), dtype=np.int64)
+        running = np.zeros(n_bins, dtype=np.int64)
+        channel_busy = np.zeros(n_frames, dtype=bool)
+        for block_first in range(0, n_frames, block_size):
+            busy = np.asarray(matrix['Data'][block_first:block_first + block_size]) > threshold
+            channel_busy[block_first:block_first + len(busy)] = busy[:, first:last].any(axis=1)
+            # boundary k means count of busy frames before frame k
+            inside = (boundaries > block_first) & (boundaries <= block_first + len(busy))
+            if np.any(inside):
+                block_cumsum = np.cumsum(busy, axis=0, dtype=np.int64)
+                cumulative[inside] = running + block_cumsum[boundaries[inside] - block_first - 1]
+            running += busy.sum(axis=0)
+        positions = np.searchsorted(boundaries, window_start)
+        windowed = (cumulative[np.searchsorted(boundaries, window_start + (window or 0))] -
+                    cumulative[positions]) / float(window or 1)
+        busy_runs, idle_runs = self.get_run_lengths(channel_busy)
+        return {'duty_cycle': running / max(n_frames, 1), 'window_start': window_start,
+                'window_timestamp': matrix['Timestamp'][window_start], 'windowed': windowed,
+                'channel_busy': channel_busy, 'busy_runs': busy_runs, 'idle_runs': idle_runs}
 
+    @FSVRProfiler.timed('max_values')
     def max_values(self):
         """
         Gets maximum value of data frames
@@ -204,21 +479,16 @@ class FSVRAnalysis:
             return False
         if not self.info_initialized:
             self.get_info()
-        # start from the 0 frame
-        self.reader.reopen_file()
+        matrix = self.load_matrix()
+        # get the index of max value over each data frame
+        max_idx = matrix['Data'].argmax(axis=1)
+        max_vals = matrix['Data'][np.arange(len(max_idx)), max_idx]
         result = {}
-        # go though the data points
-        for i in range(self.data_points):
-            self.reader.read_frame()
-            vals = list(self.reader.get_last_frame()['Data'].values())
-            keys = list(self.reader.get_last_frame()['Data'].keys())
-            # get the max value over the last data frame
-            max_val = max(vals)
-            # get the index of max value
-            max_idx = vals.index(max_val)
-            result[keys[max_idx]] = max_val
+        for key, max_val in zip(matrix['Frequency'][max_idx].tolist(), max_vals.tolist()):
+            result[key] = max_val
         return result
 
+    @FSVRProfiler.timed('values_over_threshold')
     def values_over_threshold(self):
         """
         Find which maximum values are greater than a threshold
@@ -238,6 +508,7 @@ class FSVRAnalysis:
                 result[key] = val
         return result
 
+    @FSVRProfiler.timed('avg_std_dev')
     def avg_std_dev(self):
         """
         calculates standard deviation over the maximum values over the threshold 
@@ -251,6 +522,40 @@ class FSVRAnalysis:
             res += (mn-val)**2
         return mn, np.sqrt(res/len(vals))
 
+    @FSVRProfiler.timed('threshold_sweep')
+    def threshold_sweep(self, thresholds):
+        """
+        Evaluates many candidate thresholds at once, values are sorted once and every threshold
+        is resolved by a binary search, so the cost does not grow with data size times thresholds
+        :param thresholds: list: candidate threshold levels
+        :return: dict: arrays per threshold {'threshold', 'occupation_ratio': percentage of averaged frames
+                 over the threshold as in plot_avg_values(), 'values_over_threshold': number of values
+                 of values_over_threshold(), 'mean' and 'std_dev': as in avg_std_dev(),
+                 'state_counts': thresholds x 2 numbers of averaged frames at or below and over the threshold}
+        """
+        if self.reader.get_data_frames_amount() < 2:
+            print("At least 2 data frames are needed to perform an analysis")
+            return False
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+        avg_eval = np.sort(np.asarray(self.avg_values(), dtype=np.float64))
+        max_vals = np.sort(np.fromiter(self.max_values().values(), dtype=np.float64))
+        # averaged frames strictly over the threshold
+        over = len(avg_eval) - np.searchsorted(avg_eval, thresholds, side='right')
+        # maximum values greater or equal to the threshold, moments from suffix sums of centered values
+        count = len(max_vals) - np.searchsorted(max_vals, thresholds, side='left')
+        center = max_vals.mean() if len(max_vals) > 0 else 0.0
+        deviations = max_vals - center
+        suffix_sum = np.concatenate((np.cumsum(deviations[::-1])[::-1], [0.0]))
+        suffix_squares = np.concatenate((np.cumsum((deviations ** 2)[::-1])[::-1], [0.0]))
+        first = len(max_vals) - count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_deviation = suffix_sum[first] / count
+            variance = np.maximum(suffix_squares[first] / count - mean_deviation ** 2, 0.0)
+        return {'threshold': thresholds, 'occupation_ratio': over * 100 / max(len(avg_eval), 1),
+                'values_over_threshold': count, 'mean': center + mean_deviation, 'std_dev': np.sqrt(variance),
+                'state_counts': np.stack((len(avg_eval) - over, over), axis=1)}
+
+    @FSVRProfiler.timed('avg_values')
     def avg_values(self):
         """
         Find average over the all data frame values
@@ -261,16 +566,114 @@ class FSVRAnalysis:
             return False
         if not self.info_initialized:
             self.get_info()
-        # start from the 0 frame
-        self.reader.reopen_file()
-        result = []
-        # go though the data points
-        for i in range(self.data_points):
-            self.reader.read_frame()
-            cnt = len(self.reader.get_last_frame()['Data'])
-            result.append(sum(list(self.reader.get_last_frame()['Data'].values()))/cnt)
-        return result
+        return self.load_matrix()['Data'].mean(axis=1).tolist()
+
+    @FSVRProfiler.timed('stream_statistics')
+    def stream_statistics(self, block_size=1024, zero_state=False):
+        """
+        Calculates statistics in a single pass over the data frames without caching them,
+        memory use depends only on the block size and the number of values per frame
+        :param block_size: int: number of data frames converted at once
+        :param zero_state: bool: assign Markov state 0 to the values below the lowest threshold
+        :return: FSVRStatistics: running statistics object
+        """
+        # if number of data points is not set
+        if self.get_data_points <= 0:
+            self.set_data_points(0)
+        stats = FSVRStatistics(self.thresholds, zero_state)
+        with self.lock_reader():
+            if self.is_decimated():
+                # decimated frames are collected into blocks from the frame iterator
+                frames = self.iter_frames()
+                while True:
+                    block = [frame for i, frame in zip(range(block_size), frames)]
+                    if len(block) == 0:
+                        return stats
+                    stats.update([list(frame['Data'].values()) for frame in block],
+                                 [frame['Timestamp'] for frame in block])
+            # start from the 0 frame
+            self.reader.reopen_file()
+            remaining = self.data_points
+            while remaining > 0:
+                if hasattr(self.reader, 'read_block'):
+                    block = self.reader.read_block(min(block_size, remaining))
+                    levels, timestamps = block['Data'], block['Timestamp']
+                else:
+                    levels = []
+                    timestamps = []
+                    for i in range(min(block_size, remaining)):
+                        self.reader.read_frame()
+                        levels.append(list(self.reader.get_last_frame()['Data'].values()))
+                        timestamps.append(self.reader.get_last_frame()['Timestamp'])
+                if len(levels) == 0:
+                    break
+                stats.update(levels, timestamps)
+                remaining -= len(levels)
+            return stats
+
+    def read_block(self, count):
+        """
+        Reads the next data frames of the reader into a frame matrix,
+        readers without read_block() are read frame by frame
+        :param count: int: maximal number of data frames
+        :return: dict: frame matrix, see load_matrix()
+        """
+        if hasattr(self.reader, 'read_block'):
+            return self.reader.read_block(count)
+        levels = []
+        timestamps = []
+        frames = []
+        frequency = []
+        for i in range(count):
+            try:
+                self.reader.read_frame()
+            except EOFError:
+                break
+            frame = self.reader.get_last_frame()
+            frequency = list(frame['Data'].keys())
+            levels.append(list(frame['Data'].values()))
+            timestamps.append(frame['Timestamp'])
+            frames.append(int(frame['Frame']))
+        return {'Frequency': np.array(frequency, dtype=np.float64),
+                'Data': np.array(levels, dtype=np.float64).reshape(len(levels), len(frequency)),
+                'Timestamp': np.array(timestamps, dtype=np.float64), 'Frame': np.array(frames, dtype=np.int64)}
+
+    def get_pyramid(self):
+        """
+        Loads the level pyramid saved next to the file or builds it in one pass over the file,
+        the pyramid is rebuilt when the size or modification time of the file changes
+        :return: FSVRPyramid: level pyramid of the file
+        """
+        filename = self.reader.get_filename()
+        status = os.stat(filename)
+        signature = (status.st_size, status.st_mtime_ns)
+        if self.pyramid is not None and self.pyramid.folder == filename + ".pyramid" and \
+                self.pyramid.signature == signature:
+            return self.pyramid
+        pyramid = FSVRPyramid(filename + ".pyramid")
+        if not pyramid.load(signature):
+            self.profiler.count('pyramid_builds')
+            with self.profiler.stage('build_pyramid'), self.lock_reader():
+                self.reader.reopen_file()
+                pyramid.build(self.read_block, self.reader.get_data_frames_amount(), signature)
+        self.pyramid = pyramid
+        return pyramid
+
+    def follow(self, poll_interval=0.2, timeout=None, zero_state=False):
+        """
+        Follows a dat file which is still being written and updates running statistics with every
+        batch of appended frames without rescanning earlier data, the reader must provide follow_blocks()
+        :param poll_interval: float: seconds between checks for new data
+        :param timeout: float: stop after this many seconds without new frames, follow forever if None
+        :param zero_state: bool: assign Markov state 0 to the values below the lowest threshold
+        :return: generator: FSVRStatistics object, yielded after every update
+        """
+        stats = FSVRStatistics(self.thresholds, zero_state)
+        for block in self.reader.follow_blocks(poll_interval, timeout):
+            stats.update(block['Data'], block['Timestamp'])
+            yield stats
 
+    @FSVRProfiler.timed('plot_filtering_statistic')
     def plot_filtering_statistic(self, save=True):
         """
         Plots filtered values statistic
@@ -281,16 +684,15 @@ class FSVRAnalysis:
             return False
         figure_fname = self.reader.get_filename() + "_threshold_statistic" + \
             str(self.data_points) + ".png" if save else None
-        # start from the 0 frame
-        self.reader.reopen_file()
         # get filtering statistic
         td = self.filtering_statistic_analyze()
 
-        fig, ax = self.init_plot("Data Frame", "Level", "Filtered statistic")
+        fig, ax = self.init_plot("Data Frame", "Level", "Filtered statistic", self.headless)
         # plot the threshold line
-        ax.plot([self.threshold for i in range(len(td))], 'b-')
+        ax.axhline(self.threshold, color='b')
         # plot filtered values
-        ax.plot(td, "ro")
+        index = self.get_decimation_index(td, self.plot_points)
+        ax.plot(index, np.asarray(td)[index], "ro")
         self.finish_plot(fig, ax, figure_fname)
 
     def get_markov_state(self, value, zero_state=False):
@@ -327,6 +729,65 @@ class FSVRAnalysis:
             return state
         return False
 
+    def get_markov_states(self, values, zero_state=False):
+        """
+        Assigns Markov states to a series of values in one pass, see get_markov_state()
+        :param values: list: series of levels
+        :param zero_state: bool: assign state 0 to the values below the lowest threshold
+        :return: numpy.ndarray: states, -1 for values which have no state
+        """
+        # number of thresholds strictly below the value is the state number
+        states = np.searchsorted(np.asarray(self.thresholds, dtype=np.float64),
+                                 np.asarray(values, dtype=np.float64), side='left')
+        if not zero_state:
+            states[states == 0] = -1
+        return states
+
+    @FSVRProfiler.timed('markov_transitions')
+    def markov_transitions(self, values=None, order=1, zero_state=False):
+        """
+        Counts Markov chain transitions of a given order, values without a state are skipped
+        :param values: list: series of levels, averaged values of the data frames if None
+        :param order: int: chain order, number of previous states which define the next one
+        :param zero_state: bool: assign state 0 to the values below the lowest threshold
+        :return: numpy.ndarray: transition counts indexed by (state_t-order, ..., state_t-1, state_t)
+        """
+        if values is None:
+            values = self.avg_values()
+        n_states = len(self.thresholds) + 1
+        states = self.get_markov_states(values, zero_state)
+        states = states[states >= 0]
+        shape = (n_states,) * (order + 1)
+        if len(states) <= order:
+            return np.zeros(shape, dtype=int)
+        # each window of order+1 consecutive states is one transition
+        windows = [states[i:len(states) - order + i] for i in range(order + 1)]
+        codes = np.ravel_multi_index(windows, shape)
+        return np.bincount(codes, minlength=n_states ** (order + 1)).reshape(shape).astype(int)
+
+    @FSVRProfiler.timed('markov_sojourn_times')
+    def markov_sojourn_times(self, values=None, zero_state=False):
+        """
+        Calculates histograms of dwell times in each Markov state, values without a state are skipped
+        :param values: list: series of levels, averaged values of the data frames if None
+        :param zero_state: bool: assign state 0 to the values below the lowest threshold
+        :return: dict: {state: histogram}, histogram[n] is the number of visits lasting n data frames
+        """
+        if values is None:
+            values = self.avg_values()
+        states = self.get_markov_states(values, zero_state)
+        states = states[states >= 0]
+        result = {state: np.zeros(1, dtype=int) for state in range(0 if zero_state else 1, len(self.thresholds) + 1)}
+        if len(states) == 0:
+            return result
+        # runs of the same state start where the state changes
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(states) != 0) + 1))
+        lengths = np.diff(np.concatenate((starts, [len(states)])))
+        for state in result:
+            result[state] = np.bincount(lengths[states[starts] == state], minlength=1)
+        return result
+
+    @FSVRProfiler.timed('generate_markovs_transitions')
     def generate_markovs_transitions(self, zero_state=False):
         """
         Calculates Markov chain transitions
@@ -337,18 +798,9 @@ class FSVRAnalysis:
             return False
         if not self.info_initialized:
             self.get_info()
-        markovs_transition_table = np.zeros([len(self.thresholds)+1, len(self.thresholds)+1], dtype=int)
-        result = self.avg_values()
-        # last time point to calc delta
-        last_state = -1
-        for i in range(self.get_data_points):
-            current_state = self.get_markov_state(result[i], zero_state)
-            if current_state is not False:
-                if not last_state == -1:
-                    markovs_transition_table[last_state][current_state] += 1
-                last_state = current_state
-        return markovs_transition_table
+        return self.markov_transitions(self.avg_values(), 1, zero_state)
 
+    @FSVRProfiler.timed('save_markov_transitions')
     def save_markov_transitions(self, zero_state=False):
         """
         Calculates Markov chain transitions and saves it to CSV
@@ -369,9 +821,32 @@ class FSVRAnalysis:
                 spamwriter.writerow(row)
         return markovs_transition_table
 
-    def prepare_avg_std_dev(self, files, data_points, folder=""):
+    @FSVRProfiler.timed('prepare_avg_std_dev')
+    def prepare_avg_std_dev(self, files, data_points, folder="", processes=None):
+        """
+        Calculates mean and standard deviation of the values over the threshold for several files
+        :param files: list: file names
+        :param data_points: int: number of points to analyze
+        :param folder: str: prefix added to every file name
+        :param processes: int: analyse files in parallel in this number of processes, see FSVRBatch
+        :return: list: mean values
+                 list: standard deviations
+        """
         avgs = []
         devs = []
+        if processes is not None and processes > 1:
+            from FSVRBatch import FSVRBatch
+            # the threshold may be set directly and need not be one of the thresholds
+            spec = {'thresholds': list(self.thresholds or []), 'threshold': self.threshold,
+                    'data_points': data_points, 'metrics': ['avg_std_dev']}
+            results = {result['file']: result for result in
+                       FSVRBatch(type(self.reader), processes).run([folder + file for file in files], spec)}
+            for file in files:
+                if results[folder + file]['error'] is not None:
+                    raise RuntimeError(results[folder + file]['error'])
+                avgs.append(results[folder + file]['avg'])
+                devs.append(results[folder + file]['std_dev'])
+            return avgs, devs
         for file in files:
             self.reader.reopen_file(folder + file)
             self.set_data_points(data_points)
@@ -380,50 +855,63 @@ class FSVRAnalysis:
             devs.append(dev)
         return avgs, devs
 
-    def plot_cdf(self, save=True):
+    @FSVRProfiler.timed('plot_cdf')
+    def plot_cdf(self, save=True, bins=256):
         """
-        Plots cumulative distribution function for delta time of time frames
+        Plots cumulative distribution function for delta time between data frames over the threshold
+        :param bins: int: number of CDF bins
         :return: 
         """
-        result = self.avg_values()
+        intervals = self.event_statistics()
         figure_fname = self.reader.get_filename() + "_cdf_" + str(self.data_points) + ".png" if save else None
-        # delta time points
-        ares = []
-        # last time point to calc delta
-        last_time_point = 0
-        for i in range(self.get_data_points):
-            # take only points above the threshold
-            if result[i] >= self.get_threshold:
-                ares.append(self.timeline[i] - last_time_point)
-                last_time_point = self.timeline[i]
-        # sort delta time points
-        ares = sorted(ares[1:])
-        # normalize data
-        ares1 = ares / np.sum(ares)
-        # get the cumulative sum
-        cum_ares = np.cumsum(ares1)
+        edges, cdf = FSVREvents.get_cdf(intervals['inter_arrival'], bins)
         fig, ax = self.init_plot("Delta time (s)", "CDF",
-                                 "Carrier = " + str(self.freq) + " " + self.reader.get_axis_units()[0])
-        plt.step(ares, cum_ares)
-        # axes = plt.gca()
-        # axes.set_xlim([0, ares[len(ares)-1]])
+                                 "Carrier = " + str(self.freq) + " " + self.reader.get_axis_units()[0], self.headless)
+        ax.step(edges, cdf, where='post')
         self.finish_plot(fig, ax, figure_fname,
                          "Duration = " + str(self.duration) + " s\n" +
                          "Sweep time = " + str(self.reader.get_sweep_time()) + " s\n" +
                          "F resolution = " + str(self.f_resolution) + " " + self.reader.get_axis_units()[0] + '\n' +
                          "F span = " + str(self.f_span) + " " + self.reader.get_axis_units()[0])
 
+    @FSVRProfiler.timed('event_statistics')
+    def event_statistics(self, threshold=None, values=None):
+        """
+        Calculates inter-arrival times, burst and idle durations from the frame timestamps
+        :param threshold: float: frames with values greater or equal to it are active, current threshold if None
+        :param values: list: series of levels per data frame, averaged values of the data frames if None
+        :return: dict: event intervals in seconds, see FSVREvents.get_intervals()
+        """
+        if threshold is None:
+            threshold = self.threshold
+        if values is None:
+            values = self.avg_values()
+        return FSVREvents.get_intervals(self.load_matrix()['Timestamp'], np.asarray(values) >= threshold)
+
+    def save_event_statistics(self, bins=256):
+        """
+        Calculates event intervals and saves their binned CDFs to CSV
+        :param bins: int: number of CDF bins
+        :return: dict: event intervals, see event_statistics()
+        """
+        intervals = self.event_statistics()
+        FSVREvents.save_cdf(self.reader.get_filename() + "_events_" + str(self.data_points) + ".csv", intervals, bins)
+        return intervals
+
+    @FSVRProfiler.timed('plot_avg_std_dev')
     def plot_avg_std_dev(self, mns, stds, save=True):
         stds = np.array(stds)/2
         mns = np.array(mns)
         figure_fname = self.reader.get_filename() + "_std_dev_" + \
             str(self.data_points) + ".png" if save else None
-        fig, ax = self.init_plot("Data Frame", "Level", "Standard deviation")
+        fig, ax = self.init_plot("Data Frame", "Level", "Standard deviation", self.headless)
+        index = self.get_decimation_index(mns, self.plot_points)
         # plot the threshold line
-        ax.plot(mns, 'b-')
-        ax.errorbar(range(len(mns)), mns, yerr=stds, fmt='o')
+        ax.plot(index, mns[index], 'b-')
+        ax.errorbar(index, mns[index], yerr=stds[index], fmt='o')
         self.finish_plot(fig, ax, figure_fname)
 
+    @FSVRProfiler.timed('plot_avg_values')
     def plot_avg_values(self, save=True):
         """
         Plots averaged values over the data frames
@@ -434,19 +922,20 @@ class FSVRAnalysis:
             return False
         figure_fname = self.reader.get_filename() + "_avg_" + str(self.data_points) + ".png" if save else None
         # get averaged values
-        avg_eval = self.avg_values()
+        avg_eval = np.array(self.avg_values())
 
-        values_over_threshold = sum(avg_value > self.threshold for avg_value in avg_eval)
+        values_over_threshold = int(np.sum(avg_eval > self.threshold))
         occupation_ratio = round(values_over_threshold*100 / len(avg_eval), 2)
         # initialize plot objects
         fig, ax = self.init_plot("Time (s)", "Level ("+self.reader.get_axis_units()[1]+")",
-                                 "Carrier = " + str(self.freq) + " " + self.reader.get_axis_units()[0])
-        # plot averaged levels
-        ax.plot(self.timeline, avg_eval, 'ro')
+                                 "Carrier = " + str(self.freq) + " " + self.reader.get_axis_units()[0], self.headless)
+        # plot averaged levels, min/max decimated for long captures
+        index = self.get_decimation_index(avg_eval, self.plot_points)
+        ax.plot(np.asarray(self.timeline)[index], avg_eval[index], 'ro')
         # plot horizontal threshold line
         for threshold in self.thresholds:
-            mode = 'b-' if threshold==self.threshold else 'y--'
-            ax.plot(self.timeline, [threshold for i in range(self.data_points)], mode)
+            mode = '-' if threshold==self.threshold else '--'
+            ax.axhline(threshold, color='b' if threshold==self.threshold else 'y', linestyle=mode)
         self.finish_plot(fig, ax, figure_fname,
                          "Duration = " + str(self.duration) + " s\n" +
                          "Sweep time = " + str(self.reader.get_sweep_time()) + " s\n" +
@@ -454,36 +943,95 @@ class FSVRAnalysis:
                          "F span = " + str(self.f_span) + " " + self.reader.get_axis_units()[0] + '\n' +
                          "Occupation Ratio = " + str(occupation_ratio) + "%")
 
-    def plot_last_frame(self, save=True):
+    @FSVRProfiler.timed('plot_last_frame')
+    def plot_last_frame(self, save=True, frame=None):
         """
         Plots on the graph the last frame
+        :param frame: FSVRFrame: frame to plot instead of the last frame of the reader
         :return: 
         """
         # get last frame data
-        frame = self.reader.get_last_frame()
+        if frame is None:
+            frame = self.reader.get_last_frame()
         # figure filename
         figure_fname = self.reader.get_filename() + "_figure_fr" + str(frame['Frame']) + ".png" if save else None
 
         fig, ax = self.init_plot(self.reader.get_axis_units()[0], self.reader.get_axis_units()[1],
-            "Frame #" + str(frame['Frame']) + " at " + str(frame['Timestamp']))
-        ax.plot(list(frame['Data'].keys()), list(frame['Data'].values()), 'ro')
+            "Frame #" + str(frame['Frame']) + " at " + str(frame['Timestamp']), self.headless)
+        levels = np.array(list(frame['Data'].values()))
+        index = self.get_decimation_index(levels, self.plot_points)
+        ax.plot(np.array(list(frame['Data'].keys()))[index], levels[index], 'ro')
         self.finish_plot(fig, ax, figure_fname,
                          "Carrier = "+str(self.freq)+" "+self.reader.get_axis_units()[0])
 
+    @FSVRProfiler.timed('plot_frame')
     def plot_frame(self, save=True):
         """
-        Plots set self.data_points frame
+        Plots set self.data_points frame, the last analysed one if decimated
         :return: 
         """
-        # start from the 0 frame
-        self.reader.reopen_file()
-        # go though the data points
-        for i in range(self.data_points):
-            self.reader.read_frame()
-        self.plot_last_frame(save)
+        matrix = self.load_matrix()
+        i = len(matrix['Frame']) - 1
+        self.plot_last_frame(save, FSVRFrame.from_matrix(matrix, i))
+
+    @FSVRProfiler.timed('plot_waterfall')
+    def plot_waterfall(self, save=True, mode='max', start=0, stop=None, f_start=None, f_stop=None,
+                       width=1024, height=768):
+        """
+        Plots levels of a range of data frames and frequencies as a waterfall, the finest pyramid level
+        which fits the range into width x height cells is drawn, so zooming in reads finer levels of the
+        range only and the full resolution data frames when the range is small enough. Frequency cells
+        are reduced to the width while reading when the pyramid does not store so few of them
+        :param mode: str: 'max' or 'mean' reduction of the pyramid levels
+        :param start: int: first data frame
+        :param stop: int: data frame after the last one, all data frames if None
+        :param f_start: float: lowest frequency, the first one if None
+        :param f_stop: float: highest frequency, the last one if None
+        :param width: int: maximal number of drawn frequency cells
+        :param height: int: maximal number of drawn time cells
+        :return: int: drawn pyramid level, 0 for full resolution
+        """
+        pyramid = self.get_pyramid()
+        stop = pyramid.frames if stop is None else min(stop, pyramid.frames)
+        b_start = 0 if f_start is None else int(np.searchsorted(pyramid.frequency, f_start, side='left'))
+        b_stop = pyramid.values if f_stop is None else int(np.searchsorted(pyramid.frequency, f_stop, side='right'))
+        if stop <= start or b_stop <= b_start:
+            print("At least 1 data frame and 1 frequency are required")
+            return False
+        level = pyramid.select_level(stop - start, b_stop - b_start, height, width)
+        if level > 0:
+            tile = pyramid.get_tile(level, start, stop, b_start, b_stop, mode, width)
+        elif hasattr(self.reader, 'read_matrix'):
+            tile = self.reader.read_matrix(start, stop)
+        else:
+            with self.lock_reader():
+                self.reader.reopen_file()
+                self.read_block(start)
+                tile = self.read_block(stop - start)
+        if level == 0:
+            tile = FSVRPyramid.reduce_columns({'Data': tile['Data'][:, b_start:b_stop], 'Timestamp': tile['Timestamp'],
+                                               'Frequency': tile['Frequency'][b_start:b_stop]}, width, mode)
+        # figure filename
+        figure_fname = self.reader.get_filename() + "_waterfall_" + mode + "_" + str(start) + "_" + str(stop) + \
+            ".png" if save else None
+
+        fig, ax = self.init_plot(self.reader.get_axis_units()[0], "Time, s",
+                                 "Waterfall, level " + str(level) + " " + mode, self.headless)
+        # data frames are stored from the newest one, time goes up
+        timeline = tile['Timestamp'] - np.min(tile['Timestamp'])
+        image = ax.imshow(tile['Data'], aspect='auto', interpolation='nearest', origin='upper',
+                          extent=(tile['Frequency'][0], tile['Frequency'][-1], timeline[-1], timeline[0]))
+        fig.colorbar(image, ax=ax, label=self.reader.get_axis_units()[1])
+        self.finish_plot(fig, ax, figure_fname)
+        return level
 
     def __init__(self, reader):
         """
         :param reader: reader object from an external module
         """
         self.reader = reader
+        self.filter_mask = []
+        self.timeline = []
+        self.thresholds = []
+        # reader and analyzer report to the same profiler when the reader has one
+        self.profiler = getattr(reader, 'profiler', None) or FSVRProfiler()
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Igor Kim
+E-mail: igor.skh@gmail.com
+Repository: https://bitbucket.org/igorkim/fsvrreader
+
+Batch analysis module for R&S FSVR Signal Analyzer DAT files
+
+April 2017
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import closing, nullcontext
+import glob
+import json
+import csv
+import numpy as np
+from FSVRReader import FSVRReader
+from FSVRAnalysis import FSVRAnalysis
+
+
+class FSVRBatch:
+    """
+    Runs the same analysis over many dump files in a pool of worker processes or threads,
+    every file is analysed with its own reader and analyzer objects
+    """
+    reader_class = FSVRReader  #: class: reader class used by the workers
+    processes = None  #: int: number of worker processes, number of CPUs if None
+    threads = False  #: bool: run workers in threads of this process instead of worker processes
+    metrics = ['info', 'avg_std_dev', 'occupation', 'markov']  #: list: default metrics of analysis spec
+
+    def __init__(self, reader_class=FSVRReader, processes=None, threads=False):
+        """
+        :param reader_class: reader class, must be importable by the worker processes
+        :param processes: int: number of worker processes or threads, number of CPUs if None
+        :param threads: bool: use a thread pool, files are not pickled between processes and NumPy parsing
+                        and reductions of different files overlap while they release the GIL
+        """
+        self.reader_class = reader_class
+        self.processes = processes
+        self.threads = threads
+
+    @staticmethod
+    def expand_files(files, folder=""):
+        """
+        Expands glob pattern or list of patterns to the list of files
+        :param files: str or list: file names or glob patterns
+        :param folder: str: prefix added to every file name
+        :return: list: sorted list of files
+        """
+        if isinstance(files, str):
+            files = [files]
+        result = []
+        for pattern in files:
+            matched = sorted(glob.glob(folder + pattern))
+            # keep names without matches, the worker reports them as missing files
+            result.extend(matched if len(matched) > 0 else [folder + pattern])
+        return result
+
+    def run(self, files, spec=None, folder=""):
+        """
+        Analyses files in worker processes or threads and yields results as soon as files are finished
+        :param files: str or list: file names or glob patterns
+        :param spec: dict: analysis spec {'thresholds': list, 'threshold_index': int,
+                     'threshold': float, analysis threshold level overriding threshold_index, 'data_points': int,
+                     'mask': list of frequencies, 'zero_state': bool, 'metrics': list of
+                     'header', 'info', 'averages', 'avg_std_dev', 'occupation', 'markov', 'filtering',
+                     'save_markov': bool, save Markov transitions to CSV next to the files,
+                     'plots': list of figures saved next to the files, e.g. 'avg_values', 'last_frame', 'cdf',
+                     'filtering_statistic', 'waterfall', 'plot_points': int}
+        :param folder: str: prefix added to every file name
+        :return: generator: dict per file, see analyze_file()
+        """
+        spec = dict(spec or {})
+        spec.setdefault('metrics', self.metrics)
+        files = self.expand_files(files, folder)
+        executor = ThreadPoolExecutor if self.threads else ProcessPoolExecutor
+        with executor(self.processes) as pool:
+            futures = [pool.submit(FSVRBatch.analyze_file, (self.reader_class, filename, spec))
+                       for filename in files]
+            for future in as_completed(futures):
+                yield future.result()
+
+    @staticmethod
+    def analyze_file(task):
+        """
+        Worker of run(), analyses one file
+        :param task: tuple: (reader class, file name, analysis spec)
+        :return: dict: results {'file': file name, 'error': error message or None, ... metrics}
+        """
+        reader_class, filename, spec = task
+        result = {'file': filename, 'error': None}
+        try:
+            reader = reader_class(filename)
+            # readers of the README interface need not provide close()
+            with closing(reader) if hasattr(reader, 'close') else nullcontext():
+                analyzer = FSVRAnalysis(reader)
+                analyzer.set_data_points(spec.get('data_points', 0))
+                thresholds = spec.get('thresholds', [])
+                if len(thresholds) > 0:
+                    analyzer.set_thresholds(thresholds, spec.get('threshold_index'))
+                if spec.get('threshold') is not None:
+                    analyzer.threshold = spec['threshold']
+                if 'mask' in spec:
+                    analyzer.filter_mask = spec['mask']
+                metrics = spec.get('metrics', FSVRBatch.metrics)
+                analyzer.get_info()
+                result['data_points'] = analyzer.get_data_points
+                if 'header' in metrics:
+                    result['header'] = dict(reader.header)
+                if 'info' in metrics:
+                    result.update({'freq': analyzer.freq, 'f_span': analyzer.f_span,
+                                   'f_resolution': analyzer.f_resolution, 'start_ts': float(analyzer.start_ts),
+                                   'end_ts': float(analyzer.end_ts), 'duration': float(analyzer.duration),
+                                   'sweep_time': reader.get_sweep_time()})
+                if 'averages' in metrics:
+                    avg_eval = np.array(analyzer.avg_values())
+                    result.update({'avg_level': float(np.mean(avg_eval)), 'min_avg_level': float(np.min(avg_eval)),
+                                   'max_avg_level': float(np.max(avg_eval))})
+                if 'avg_std_dev' in metrics:
+                    if len(analyzer.values_over_threshold()) > 0:
+                        avg, dev = analyzer.avg_std_dev()
+                    else:
+                        # no maximum value reaches the threshold, reported as by threshold_sweep()
+                        avg, dev = np.nan, np.nan
+                    result.update({'avg': float(avg), 'std_dev': float(dev)})
+                if 'occupation' in metrics:
+                    avg_eval = np.array(analyzer.avg_values())
+                    result['occupation_ratio'] = round(float(np.sum(avg_eval > analyzer.threshold))*100 / len(avg_eval), 2)
+                if 'markov' in metrics:
+                    if spec.get('save_markov', False):
+                        table = analyzer.save_markov_transitions(spec.get('zero_state', False))
+                        result['markov_file'] = reader.get_filename() + "_markovs_" + str(analyzer.data_points) + ".csv"
+                    else:
+                        table = analyzer.generate_markovs_transitions(spec.get('zero_state', False))
+                    result['markov'] = np.asarray(table).tolist()
+                if 'filtering' in metrics:
+                    result['filtering'] = float(np.mean(analyzer.filtering_statistic_analyze()))
+                if len(spec.get('plots', [])) > 0:
+                    # figures are rendered in the worker without pyplot
+                    analyzer.headless = True
+                    analyzer.plot_points = spec.get('plot_points', analyzer.plot_points)
+                    for plot in spec['plots']:
+                        getattr(analyzer, 'plot_' + plot)()
+                    result['plots'] = list(spec['plots'])
+        except Exception as e:
+            result['error'] = type(e).__name__ + ": " + str(e)
+        return result
+
+    @staticmethod
+    def save_summary(results, filename):
+        """
+        Saves batch results to a single JSON file or CSV file, chosen by the file extension
+        :param results: list: results of run()
+        :param filename: str: path to the summary file, *.json or *.csv
+        :return: list: saved results
+        """
+        with open(filename, 'w', newline='') as fout:
+            return FSVRBatch.write_summary(results, fout, "json" if filename.lower().endswith(".json") else "csv")
+
+    @staticmethod
+    def write_summary(results, stream, fmt="json"):
+        """
+        Writes batch results sorted by file name as JSON or CSV with a row per file
+        :param results: list: results of run() or analyze_file()
+        :param stream: object: text stream, e.g. an open file or sys.stdout
+        :param fmt: str: 'json' or 'csv'
+        :return: list: written results
+        """
+        results = sorted(results, key=lambda item: item['file'])
+        if fmt == "json":
+            json.dump(results, stream, indent=2)
+            stream.write("\n")
+            return results
+        columns = []
+        for result in results:
+            columns.extend(key for key in result if key not in columns)
+        spamwriter = csv.writer(stream, delimiter=';', quotechar='|', quoting=csv.QUOTE_MINIMAL)
+        spamwriter.writerow(columns)
+        for result in results:
+            # nested values, e.g. Markov tables, are written as JSON
+            spamwriter.writerow([json.dumps(result[key]) if isinstance(result.get(key), (list, dict))
+                                 else result.get(key, "") for key in columns])
+        return results
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Igor Kim
+E-mail: igor.skh@gmail.com
+Repository: https://bitbucket.org/igorkim/fsvrreader
+
+Benchmark suite for the reader and analysis modules on synthetic DAT files
+
+April 2017
+
+Usage: python FSVRBenchmark.py --sizes 1000 10000 100000 1000000 --values 691 --json results.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import warnings
+
+
+class FSVRBenchmark:
+    """
+    Times reader and analysis stages on synthetic files of different sizes, every stage runs
+    in a fresh process, so the timings are cold and peak RSS belongs to the stage only
+    """
+    stages = ['header', 'frames', 'matrix', 'get_info', 'avg_values', 'max_values', 'markov', 'plot']  #: list
+    folder = "benchmark"  #: str: folder for generated files and figures
+    values = 691  #: int: number of points per frame
+    thresholds = [-90, -80]  #: list: thresholds used by the analysis stages
+
+    def __init__(self, folder="benchmark", values=691, stages=None):
+        """
+        :param folder: str: folder for generated files and figures
+        :param values: int: number of points per frame
+        :param stages: list: stages to run, all if None
+        """
+        self.folder = folder
+        self.values = values
+        if stages is not None:
+            self.stages = stages
+
+    def prepare_file(self, frames):
+        """
+        Generates synthetic file for a size unless it already exists
+        :param frames: int: number of data frames
+        :return: str: path to the file
+        """
+        from FSVRGenerator import FSVRGenerator
+        os.makedirs(self.folder, exist_ok=True)
+        filename = os.path.join(self.folder, "synthetic_%d_%d.DAT" % (frames, self.values))
+        if not os.path.isfile(filename):
+            FSVRGenerator(frames, self.values).write(filename)
+        return filename
+
+    @staticmethod
+    def run_stage(stage, filename):
+        """
+        Runs one stage in the current process
+        :param stage: str: stage name
+        :param filename: str: path to the file
+        :return: dict: {'stage', 'seconds', 'frames', 'peak_rss_kb'}
+        """
+        from FSVRReader import FSVRReader
+        from FSVRAnalysis import FSVRAnalysis
+        warnings.simplefilter("ignore")
+        start = time.perf_counter()
+        reader = FSVRReader(filename)
+        frames = reader.get_data_frames_amount()
+        analyzer = FSVRAnalysis(reader)
+        analyzer.set_data_points(0)
+        analyzer.set_thresholds(FSVRBenchmark.thresholds)
+        if stage == 'header':
+            frames = 0
+        elif stage == 'frames':
+            for i in range(frames):
+                reader.read_frame()
+        elif stage == 'matrix':
+            reader.read_matrix()
+        elif stage == 'get_info':
+            analyzer.get_info()
+        elif stage == 'avg_values':
+            analyzer.avg_values()
+        elif stage == 'max_values':
+            analyzer.max_values()
+        elif stage == 'markov':
+            analyzer.generate_markovs_transitions()
+        elif stage == 'plot':
+            analyzer.plot_avg_values()
+        else:
+            raise ValueError("Unknown stage " + stage)
+        seconds = time.perf_counter() - start
+        return {'stage': stage, 'seconds': seconds, 'frames': frames, 'peak_rss_kb': FSVRBenchmark.get_peak_rss()}
+
+    @staticmethod
+    def get_peak_rss():
+        """
+        :return: int: peak resident set size of the current process in kilobytes, 0 if it is not available
+        """
+        # ru_maxrss on Linux keeps the peak of the parent process from before exec, VmHWM does not
+        if os.path.isfile("/proc/self/status"):
+            with open("/proc/self/status") as status:
+                for line in status:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1])
+        try:
+            import resource
+        except ImportError:
+            # resource is not available on Windows
+            return 0
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak_rss // 1024 if sys.platform == "darwin" else peak_rss
+
+    def run(self, sizes):
+        """
+        Runs all stages for all sizes, each stage in a separate process
+        :param sizes: list: numbers of data frames
+        :return: list: dict per size and stage {'size', 'stage', 'seconds', 'frames_per_s', 'mb_per_s',
+                 'peak_rss_kb', 'file_mb'}
+        """
+        results = []
+        env = dict(os.environ, MPLBACKEND="Agg")
+        for size in sizes:
+            filename = self.prepare_file(size)
+            file_mb = os.path.getsize(filename) / 2**20
+            for stage in self.stages:
+                output = subprocess.run([sys.executable, os.path.abspath(__file__), "--stage", stage, filename],
+                                        env=env, check=True, stdout=subprocess.PIPE, universal_newlines=True)
+                result = json.loads(output.stdout.strip().splitlines()[-1])
+                seconds = max(result['seconds'], 1e-9)
+                result.update({'size': size, 'file_mb': round(file_mb, 2),
+                               'frames_per_s': round(result['frames'] / seconds, 1),
+                               'mb_per_s': round(file_mb / seconds, 2) if stage != 'header' else None})
+                results.append(result)
+                print("%9d %-11s %9.3f s %12s frames/s %9s MB/s %9d KB peak RSS" % (
+                    size, stage, result['seconds'], result['frames_per_s'], result['mb_per_s'],
+                    result['peak_rss_kb']))
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark FSVR reader and analysis on synthetic files")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="numbers of data frames, e.g. 1000 10000 100000 1000000")
+    parser.add_argument("--values", type=int, default=691, help="number of points per frame")
+    parser.add_argument("--folder", default="benchmark", help="folder for generated files")
+    parser.add_argument("--stages", nargs="+", default=None, help="stages to run: " + " ".join(FSVRBenchmark.stages))
+    parser.add_argument("--json", default=None, help="save results to a JSON file")
+    parser.add_argument("--stage", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("file", nargs="?", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.stage is not None:
+        # child process of run()
+        print(json.dumps(FSVRBenchmark.run_stage(args.stage, args.file)))
+    else:
+        benchmark_results = FSVRBenchmark(args.folder, args.values, args.stages).run(args.sizes)
+        if args.json is not None:
+            with open(args.json, "w") as json_file:
+                json.dump(benchmark_results, json_file, indent=2)
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Igor Kim
+E-mail: igor.skh@gmail.com
+Repository: https://bitbucket.org/igorkim/fsvrreader
+
+Command-line interface for R&S FSVR Signal Analyzer DAT files
+
+April 2017
+"""
+import argparse
+import os
+import sys
+from FSVRReader import FSVRReader
+from FSVRBatch import FSVRBatch
+
+
+class FSVRCli:
+    """
+    Command-line entry point with info, stats, markov and plot subcommands, results are printed
+    as JSON or CSV with a row per file. Plotting libraries are imported by the plot subcommand only
+    """
+    #: dict: analysis metrics of the subcommands, see FSVRBatch.run()
+    commands = {'info': ['header', 'info'],
+                'stats': ['averages', 'occupation', 'avg_std_dev'],
+                'markov': ['markov'],
+                'plot': []}
+    #: list: figures of the plot subcommand, named after plot_* methods of FSVRAnalysis
+    plots = ['avg_values', 'last_frame', 'frame', 'cdf', 'filtering_statistic', 'waterfall']
+
+    @staticmethod
+    def get_parser():
+        """
+        :return: argparse.ArgumentParser: parser of the command-line arguments
+        """
+        parser = argparse.ArgumentParser(prog="fsvr", description="Analyse R&S FSVR Signal Analyzer DAT files")
+        subparsers = parser.add_subparsers(dest="command", required=True)
+        for command, help_text in (("info", "header and basic info of the files"),
+                                   ("stats", "averages, occupation ratio, mean and standard deviation of the "
+                                             "maximum values over the threshold"),
+                                   ("markov", "Markov chain transitions of the averaged values"),
+                                   ("plot", "save figures next to the files")):
+            subparser = subparsers.add_parser(command, help=help_text)
+            subparser.add_argument("files", nargs="+", help="dat files or glob patterns")
+            subparser.add_argument("--format", choices=["json", "csv"], default="json", help="output format")
+            subparser.add_argument("--output", default=None, help="output file, standard output by default")
+            subparser.add_argument("--data-points", type=int, default=0,
+                                   help="number of analysed data frames, all frames if 0")
+            subparser.add_argument("--thresholds", type=float, nargs="+", default=[], help="threshold levels")
+            subparser.add_argument("--threshold-index", type=int, default=None,
+                                   help="index of the analysis threshold, the first one by default")
+            subparser.add_argument("--processes", type=int, default=1,
+                                   help="number of worker processes, files are analysed in this process if 1")
+            subparser.add_argument("--threads", action="store_true",
+                                   help="run the workers in threads of this process instead of processes")
+            subparser.add_argument("--columnar", action="store_true",
+                                   help="files are columnar stores, see FSVRColumnarReader")
+            if command == "markov":
+                subparser.add_argument("--zero-state", action="store_true",
+                                       help="assign state 0 to the values below the lowest threshold")
+                subparser.add_argument("--save", action="store_true",
+                                       help="save transitions to CSV next to the files as save_markov_transitions()")
+            if command == "plot":
+                subparser.add_argument("--plots", nargs="+", choices=FSVRCli.plots, default=['avg_values'],
+                                       help="figures to save")
+                subparser.add_argument("--plot-points", type=int, default=2000,
+                                       help="maximal number of drawn points of a series")
+                subparser.add_argument("--mask", type=float, nargs="+", default=[],
+                                       help="frequencies averaged by the filtering_statistic figure")
+        return parser
+
+    @staticmethod
+    def get_spec(args):
+        """
+        :param args: argparse.Namespace: parsed command-line arguments
+        :return: dict: analysis spec, see FSVRBatch.run()
+        """
+        spec = {'metrics': FSVRCli.commands[args.command], 'data_points': args.data_points,
+                'thresholds': args.thresholds, 'threshold_index': args.threshold_index}
+        if args.command == "markov":
+            spec.update({'zero_state': args.zero_state, 'save_markov': args.save})
+        if args.command == "plot":
+            spec.update({'plots': args.plots, 'plot_points': args.plot_points})
+            if len(args.mask) > 0:
+                spec['mask'] = args.mask
+        return spec
+
+    @staticmethod
+    def run(args):
+        """
+        Analyses the files of the parsed arguments
+        :param args: argparse.Namespace: parsed command-line arguments
+        :return: list: results per file, see FSVRBatch.analyze_file()
+        """
+        if args.columnar:
+            from FSVRColumnarReader import FSVRColumnarReader
+            reader_class = FSVRColumnarReader
+        else:
+            reader_class = FSVRReader
+        spec = FSVRCli.get_spec(args)
+        if args.processes > 1:
+            return list(FSVRBatch(reader_class, args.processes, args.threads).run(args.files, spec))
+        # short jobs do not pay for starting a process pool
+        return [FSVRBatch.analyze_file((reader_class, filename, spec))
+                for filename in FSVRBatch.expand_files(args.files)]
+
+    @staticmethod
+    def main(argv=None):
+        """
+        Entry point of the fsvr command
+        :param argv: list: command-line arguments, sys.argv[1:] if None
+        :return: int: exit status, 1 if any file failed
+        """
+        args = FSVRCli.get_parser().parse_args(argv)
+        if args.command == "markov" and len(args.thresholds) == 0:
+            print("At least 1 threshold is needed to calculate Markov chain transitions", file=sys.stderr)
+            return 2
+        if args.command == "stats" and len(args.thresholds) == 0:
+            print("At least 1 threshold is needed to calculate statistics over the threshold", file=sys.stderr)
+            return 2
+        if args.command == "plot" and 'filtering_statistic' in args.plots and len(args.mask) == 0:
+            print("Frequencies of the filtering statistic are given by --mask", file=sys.stderr)
+            return 2
+        results = FSVRCli.run(args)
+        if args.output is None:
+            FSVRBatch.write_summary(results, sys.stdout, args.format)
+        else:
+            with open(args.output, 'w', newline='') as fout:
+                FSVRBatch.write_summary(results, fout, args.format)
+        for result in results:
+            if result['error'] is not None:
+                print(os.path.basename(result['file']) + ": " + result['error'], file=sys.stderr)
+        return 1 if any(result['error'] is not None for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(FSVRCli.main())
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Igor Kim
+E-mail: igor.skh@gmail.com
+Repository: https://bitbucket.org/igorkim/fsvrreader
+
+Columnar store reader for R&S FSVR Signal Analyzer dump files converted from DAT
+
+April 2017
+
+Usage: python FSVRColumnarReader.py sample.DAT --store sample.DAT.fsvrc --chunk-frames 1024 --chunk-values 256
+"""
+import argparse
+import json
+import os
+import numpy as np
+from FSVRProfiler import FSVRProfiler
+from FSVRFrame import FSVRFrame
+
+
+class FSVRColumnarReader:
+    """
+    Reader of dump files converted to a chunked columnar store, implements the reader interface of FSVRAnalysis.
+    The store is a folder with meta.npz (header, frequencies, timestamps and frame numbers) and one compressed
+    chunk_<n>.npz file per chunk of frames holding one levels_<k> array per chunk of frequencies,
+    so reads load only the chunks overlapping the requested frames and frequencies
+    """
+    file_path = ""  #: str: path to the store folder
+    last_frame = {}  #: FSVRFrame: last data frame data
+    header = {}  #: dict: header dictionary of the converted dat file
+    frequency = None  #: numpy.ndarray: read-only frequency axis shared by the frames
+    timestamps = None  #: numpy.ndarray: timestamps of all frames
+    frames = None  #: numpy.ndarray: frame numbers of all frames
+    chunk_frames = 1024  #: int: number of frames per chunk
+    chunk_values = 256  #: int: number of frequencies per chunk
+    position = 0  #: int: position of the frame read next by read_frame() and read_block()
+    chunk = None  #: tuple: (chunk number, {frequency chunk number: levels}) of the chunk loaded last
+    profiler = None  #: FSVRProfiler: timers and counters of the reader stages
+
+    def __init__(self, filename=None):
+        """
+        :param filename: path to the store folder
+        """
+        self.header = {}
+        self.last_frame = {}
+        self.profiler = FSVRProfiler()
+        if filename is not None:
+            self.reopen_file(filename)
+
+    @staticmethod
+    def get_meta_path(store):
+        """
+        :param store: str: path to the store folder
+        :return: str: path to the metadata file of the store
+        """
+        return os.path.join(store, "meta.npz")
+
+    @staticmethod
+    def get_chunk_path(store, n):
+        """
+        :param store: str: path to the store folder
+        :param n: int: chunk number
+        :return: str: path to the chunk file of the store
+        """
+        return os.path.join(store, "chunk_%06d.npz" % n)
+
+    @staticmethod
+    def convert(filename, store=None, chunk_frames=1024, chunk_values=256, dtype=np.float64, reader=None):
+        """
+        Converts a dat file to a columnar store, frames are read and written chunk by chunk,
+        so memory does not depend on the size of the file. Metadata is written last, an interrupted
+        conversion does not leave a readable store
+        :param filename: str: path to the dat file
+        :param store: str: path to the store folder, <filename>.fsvrc if None
+        :param chunk_frames: int: number of frames per chunk
+        :param chunk_values: int: number of frequencies per chunk
+        :param dtype: numpy dtype of the stored levels
+        :param reader: object: reader of the dat file, FSVRReader if None
+        :return: str: path to the store folder
+        """
+        if reader is None:
+            from FSVRReader import FSVRReader
+            reader = FSVRReader(filename)
+        else:
+            reader.reopen_file(filename)
+        if store is None:
+            store = filename + ".fsvrc"
+        os.makedirs(store, exist_ok=True)
+        frequency = np.empty(0)
+        timestamps = []
+        frames = []
+        n = 0
+        while True:
+            block = reader.read_block(chunk_frames, dtype)
+            if len(block['Frame']) == 0:
+                break
+            if n == 0:
+                frequency = block['Frequency']
+            levels = {"levels_%d" % k: block['Data'][:, j:j + chunk_values]
+                      for k, j in enumerate(range(0, block['Data'].shape[1], chunk_values))}
+            path = FSVRColumnarReader.get_chunk_path(store, n)
+            with open(path + ".tmp", "wb") as fout:
+                np.savez_compressed(fout, **levels)
+            os.replace(path + ".tmp", path)
+            timestamps.append(block['Timestamp'])
+            frames.append(block['Frame'])
+            n += 1
+        meta_path = FSVRColumnarReader.get_meta_path(store)
+        with open(meta_path + ".tmp", "wb") as fout:
+            np.savez(fout, Header=np.array(json.dumps(reader.header)), Frequency=frequency,
+                     Timestamp=np.concatenate(timestamps) if n > 0 else np.empty(0),
+                     Frame=np.concatenate(frames) if n > 0 else np.empty(0, dtype=np.int64),
+                     Chunks=np.array([chunk_frames, chunk_values], dtype=np.int64))
+        os.replace(meta_path + ".tmp", meta_path)
+        return store
+
+    def reopen_file(self, filename=None):
+        """
+        Opens the store and resets the position to the first frame
+        :param filename: path to the store folder, current store if None
+        :return: str: path to the store folder
+        """
+        if filename is None:
+            filename = self.file_path
+        if not os.path.isfile(self.get_meta_path(filename)):
+            raise FileNotFoundError("Store " + filename + " does not exist")
+        self.profiler.count('reopens')
+        with np.load(self.get_meta_path(filename)) as meta:
+            self.header = json.loads(str(meta['Header']))
+            self.frequency = FSVRFrame.get_shared_frequency(meta['Frequency'])
+            self.timestamps = meta['Timestamp']
+            self.frames = meta['Frame']
+            self.chunk_frames, self.chunk_values = meta['Chunks'].tolist()
+        self.file_path = filename
+        self.position = 0
+        self.chunk = None
+        return self.file_path
+
+    def close(self):
+        """
+        Drops the cached chunk, the store has no open files between reads
+        :return:
+        """
+        self.chunk = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_filename(self):
+        """
+        :return: string: path to the store folder
+        """
+        return self.file_path
+
+    def get_axis_units(self):
+        """
+        :return: tuple: (x unit,y unit)
+        """
+        if len(self.header) == 0:
+            raise RuntimeError("Header has not been initialized")
+        return self.header['x-Unit'][0], self.header['y-Unit'][0]
+
+    def get_data_frames_amount(self):
+        """
+        :return: int: number of data frames in the store
+        """
+        if self.frames is None:
+            raise RuntimeError("Store has not been initialized")
+        return len(self.frames)
+
+    def get_sweep_time(self):
+        """
+        Returns sweep time got from a header
+        :return: float: sweep time
+        """
+        if len(self.header) == 0:
+            raise RuntimeError("Header has not been initialized")
+        return float(self.header['SWT'][0])
+
+    def get_last_frame(self):
+        """
+        :return: object: last frame object
+        """
+        if len(self.last_frame) == 0:
+            raise RuntimeError("Last frame information does not exists, run read_frame first")
+        return self.last_frame
+
+    def get_columns(self, f_start=None, f_stop=None):
+        """
+        :param f_start: float: lowest frequency, from the first frequency if None
+        :param f_stop: float: highest frequency, up to the last frequency if None
+        :return: tuple: (first column, column after the last one) of the frequency range
+        """
+        if self.frequency is None:
+            raise RuntimeError("Store has not been initialized")
+        lo = 0 if f_start is None else int(np.searchsorted(self.frequency, f_start, side='left'))
+        hi = len(self.frequency) if f_stop is None else int(np.searchsorted(self.frequency, f_stop, side='right'))
+        return lo, max(lo, hi)
+
+    def load_levels(self, n, k):
+        """
+        Loads levels of a frame chunk and a frequency chunk, frequency chunks of the last loaded frame chunk are kept
+        :param n: int: frame chunk number
+        :param k: int: frequency chunk number
+        :return: numpy.ndarray: frames x values array of levels
+        """
+        # the cached chunk is taken once, threads sharing the reader may replace it meanwhile
+        chunk = self.chunk
+        if chunk is None or chunk[0] != n:
+            chunk = self.chunk = (n, {})
+        if k not in chunk[1]:
+            with self.profiler.stage('load_chunk'), np.load(self.get_chunk_path(self.file_path, n)) as data:
+                chunk[1][k] = data["levels_%d" % k]
+            self.profiler.count('chunks_loaded')
+            self.profiler.count('values_loaded', chunk[1][k].size)
+        return chunk[1][k]
+
+    def read_chunks(self, start=0, stop=None, f_start=None, f_stop=None, dtype=np.float64):
+        """
+        Reads a range of frames and frequencies chunk by chunk
+        :param start: int: index of the first frame to read
+        :param stop: int: index after the last frame to read, all frames if None
+        :param f_start: float: lowest frequency, from the first frequency if None
+        :param f_stop: float: highest frequency, up to the last frequency if None
+        :param dtype: numpy dtype of the level matrix
+        :return: generator: frame matrices of the frames of one chunk, see FSVRReader.read_block()
+        """
+        total = self.get_data_frames_amount()
+        if stop is None or stop > total:
+            stop = total
+        start = max(start, 0)
+        stop = max(stop, start)
+        lo, hi = self.get_columns(f_start, f_stop)
+        for n in range(start // self.chunk_frames, -(-stop // self.chunk_frames)):
+            first = max(start, n * self.chunk_frames)
+            last = min(stop, (n + 1) * self.chunk_frames)
+            rows = slice(first - n * self.chunk_frames, last - n * self.chunk_frames)
+            levels = np.empty((last - first, hi - lo), dtype=dtype)
+            for k in range(lo // self.chunk_values, -(-hi // self.chunk_values)):
+                j0 = max(lo, k * self.chunk_values)
+                j1 = min(hi, (k + 1) * self.chunk_values)
+                levels[:, j0 - lo:j1 - lo] = self.load_levels(n, k)[rows, j0 - k * self.chunk_values:
+                                                                        j1 - k * self.chunk_values]
+            yield {'Frequency': self.frequency[lo:hi], 'Data': levels,
+                   'Timestamp': self.timestamps[first:last], 'Frame': self.frames[first:last]}
+
+    def iter_frames(self, start=0, stop=None, step=1, fields=None, dtype=np.float64):
+        """
+        Yields frames lazily from start to stop taking every step-th frame, only the chunks holding
+        the yielded frames are loaded
+        :param start: int: position of the first frame
+        :param stop: int: position after the last frame, all frames if None
+        :param step: int: distance between yielded frames
+        :param fields: list: fields of the yielded frames, 'Frame' and 'Timestamp' are always set,
+                       levels only with 'Data', all if None
+        :param dtype: numpy dtype of the levels
+        :return: generator: FSVRFrame frames
+        """
+        if step < 1:
+            raise ValueError("Step must be a positive number")
+        levels = fields is None or 'Data' in fields
+        chunks = -(-len(self.frequency) // self.chunk_values)
+        for i in range(*slice(max(start, 0), stop, step).indices(self.get_data_frames_amount())):
+            frame = FSVRFrame(self.frames[i], self.timestamps[i], self.frequency, None)
+            if levels:
+                n, row = divmod(i, self.chunk_frames)
+                frame.levels = np.concatenate([self.load_levels(n, k)[row] for k in range(chunks)]).astype(dtype)
+            yield frame
+
+    def read_matrix(self, start=0, stop=None, dtype=np.float64, f_start=None, f_stop=None):
+        """
+        Reads a range of frames and frequencies into a level matrix
+        :param start: int: index of the first frame to read
+        :param stop: int: index after the last frame to read, all frames if None
+        :param dtype: numpy dtype of the level matrix
+        :param f_start: float: lowest frequency, from the first frequency if None
+        :param f_stop: float: highest frequency, up to the last frequency if None
+        :return: dict: frame matrix, see FSVRReader.read_block()
+        """
+        lo, hi = self.get_columns(f_start, f_stop)
+        blocks = list(self.read_chunks(start, stop, f_start, f_stop, dtype))
+        if len(blocks) == 0:
+            return {'Frequency': self.frequency[lo:hi], 'Data': np.empty((0, hi - lo), dtype=dtype),
+                    'Timestamp': np.empty(0), 'Frame': np.empty(0, dtype=np.int64)}
+        matrix = {'Frequency': blocks[0]['Frequency'],
+                  'Data': np.concatenate([block['Data'] for block in blocks]),
+                  'Timestamp': np.concatenate([block['Timestamp'] for block in blocks]),
+                  'Frame': np.concatenate([block['Frame'] for block in blocks])}
+        self.update_last_frame(matrix)
+        return matrix
+
+    def read_block(self, count, dtype=np.float64):
+        """
+        Reads next frames into a level matrix
+        :param count: int: number of frames to read
+        :param dtype: numpy dtype of the level matrix
+        :return: dict: frame matrix, see FSVRReader.read_block()
+        """
+        matrix = self.read_matrix(self.position, self.position + count, dtype)
+        self.position += len(matrix['Frame'])
+        return matrix
+
+    def read_frame(self):
+        """
+        Reads next frame
+        :return: FSVRFrame: frame data
+        """
+        if len(self.read_block(1)['Frame']) == 0:
+            raise EOFError("No frame left in the store")
+        return self.last_frame
+
+    def update_last_frame(self, matrix):
+        """
+        Sets the last frame from the last row of a frame matrix
+        :param matrix: dict: frame matrix, see FSVRReader.read_block()
+        :return:
+        """
+        if len(matrix['Frame']) > 0:
+            self.last_frame = FSVRFrame.from_matrix(matrix, -1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert FSVR DAT files to chunked columnar stores")
+    parser.add_argument("files", nargs="+", help="dat files")
+    parser.add_argument("--store", default=None, help="store folder of a single file, <file>.fsvrc by default")
+    parser.add_argument("--chunk-frames", type=int, default=1024, help="number of frames per chunk")
+    parser.add_argument("--chunk-values", type=int, default=256, help="number of frequencies per chunk")
+    parser.add_argument("--dtype", default="float64", help="stored level type, e.g. float64 or float32")
+    args = parser.parse_args()
+    if args.store is not None and len(args.files) > 1:
+        parser.error("--store can be used with a single file only")
+    for dat_file in args.files:
+        print(FSVRColumnarReader.convert(dat_file, args.store, args.chunk_frames, args.chunk_values,
+                                         np.dtype(args.dtype)))
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Igor Kim
+E-mail: igor.skh@gmail.com
+Repository: https://bitbucket.org/igorkim/fsvrreader
+
+Compressed input module for R&S FSVR Signal Analyzer dump files
+
+April 2017
+"""
+import bisect
+import bz2
+import io
+import lzma
+import os
+import zlib
+
+
+class FSVRCompressedFile(io.RawIOBase):
+    """
+    Seekable read-only stream of a gzip, bz2, xz, zlib or zstd compressed file, decompressed on the fly
+    chunk by chunk, so the compressed file is read only once per pass. Gzip and zlib streams keep copies
+    of the decompressor every checkpoint_interval bytes of output and seeking backwards restarts from
+    the nearest checkpoint, other streams restart from the beginning of the file
+    """
+    #: tuple: (magic bytes, compression) pairs, zlib streams are recognized by their header checksum
+    signatures = ((b"\x1f\x8b", 'gzip'), (b"BZh", 'bz2'), (b"\xfd7zXZ\x00", 'xz'), (b"\x28\xb5\x2f\xfd", 'zstd'))
+    chunk_size = 1 << 18  #: int: number of compressed bytes decompressed at once
+    checkpoint_interval = 1 << 22  #: int: distance between decompressor checkpoints in decompressed bytes
+    lookback = 1 << 21  #: int: decompressed bytes kept before the current position for short backward seeks
+    filename = ""  #: str: path to the compressed file
+    compression = None  #: str: 'gzip', 'bz2', 'xz', 'zlib' or 'zstd'
+    signature = None  #: tuple: (size, modification time in ns) of the compressed file when it was opened
+    checkpoints = None  #: list: (decompressed offset, compressed offset, decompressor copy or None) tuples
+    size = None  #: int: decompressed size, None until the end of the stream is reached
+    profiler = None  #: FSVRProfiler: receives compressed_bytes_read and bytes_decompressed counters
+
+    def __init__(self, filename, compression=None, profiler=None):
+        """
+        :param filename: str: path to the compressed file
+        :param compression: str: compression of the file, detected by get_compression() if None
+        :param profiler: FSVRProfiler: profiler counting read and decompressed bytes
+        """
+        super().__init__()
+        self.compression = compression or self.get_compression(filename)
+        if self.compression is None:
+            raise ValueError("File " + filename + " is not compressed")
+        self.filename = filename
+        self.profiler = profiler
+        self.file = open(filename, "rb")
+        stat = os.fstat(self.file.fileno())
+        self.signature = stat.st_size, stat.st_mtime_ns
+        self.checkpoints = [(0, 0, None)]
+        self.restore(self.checkpoints[0])
+
+    @staticmethod
+    def get_compression(filename):
+        """
+        Detects compression of a file by its first bytes
+        :param filename: str: path to the file
+        :return: str: 'gzip', 'bz2', 'xz', 'zlib', 'zstd' or None for not compressed files
+        """
+        with open(filename, "rb") as fin:
+            head = fin.read(64)
+        for magic, compression in FSVRCompressedFile.signatures:
+            if head.startswith(magic):
+                return compression
+        # deflate method, window up to 32K and the header checksum, confirmed by decompressing the head
+        if len(head) >= 2 and head[0] & 0x0f == 8 and head[0] >> 4 <= 7 and (head[0] * 256 + head[1]) % 31 == 0:
+            try:
+                zlib.decompressobj().decompress(head)
+                return 'zlib'
+            except zlib.error:
+                return None
+        return None
+
+    @staticmethod
+    def get_decompressor(compression):
+        """
+        :param compression: str: 'gzip', 'bz2', 'xz', 'zlib' or 'zstd'
+        :return: object: decompressor object of a single stream
+        """
+        if compression == 'gzip':
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if compression == 'zlib':
+            return zlib.decompressobj()
+        if compression == 'bz2':
+            return bz2.BZ2Decompressor()
+        if compression == 'xz':
+            return lzma.LZMADecompressor()
+        if compression == 'zstd':
+            try:
+                from compression import zstd
+                return zstd.ZstdDecompressor()
+            except ImportError:
+                pass
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportError("zstd files require Python 3.14 or the zstandard package")
+            return zstandard.ZstdDecompressor().decompressobj()
+        raise ValueError("Unknown compression " + str(compression))
+
+    @staticmethod
+    def open_text(filename, compression=None, profiler=None, buffer_size=1 << 20):
+        """
+        Opens a compressed file as a text file, the same way open(filename, "r") opens a plain one
+        :param filename: str: path to the compressed file
+        :param compression: str: compression of the file, detected if None
+        :param profiler: FSVRProfiler: profiler counting read and decompressed bytes
+        :param buffer_size: int: size of the decompressed read buffer
+        :return: io.TextIOWrapper: text file, file.buffer.raw is the FSVRCompressedFile object
+        """
+        return io.TextIOWrapper(io.BufferedReader(FSVRCompressedFile(filename, compression, profiler), buffer_size))
+
+    def restore(self, checkpoint):
+        """
+        Restarts decompression from a checkpoint
+        :param checkpoint: tuple: (decompressed offset, compressed offset, decompressor copy or None)
+        :return:
+        """
+        position, offset, decompressor = checkpoint
+        self.file.seek(offset)
+        self.decompressor = self.get_decompressor(self.compression) if decompressor is None else decompressor.copy()
+        self.output = b""
+        self.output_start = position
+        self.position = position
+        self.finished = False
+
+    def fill(self):
+        """
+        Decompresses the next chunk, output more than lookback bytes before the current position is dropped
+        :return: bool: False at the end of the stream
+        """
+        if self.finished:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if self.profiler is not None:
+            self.profiler.count('compressed_bytes_read', len(chunk))
+        if not chunk:
+            # truncated streams end where the data ends, like truncated plain files
+            self.finished = True
+            self.size = self.output_start + len(self.output)
+            return False
+        parts = []
+        while chunk:
+            if getattr(self.decompressor, 'eof', False):
+                # zlib has a single stream, gzip, bz2, xz and zstd files may concatenate several ones
+                if self.compression == 'zlib':
+                    break
+                self.decompressor = self.get_decompressor(self.compression)
+            parts.append(self.decompressor.decompress(chunk))
+            chunk = self.decompressor.unused_data if getattr(self.decompressor, 'eof', False) else b""
+        data = b"".join(parts)
+        if self.profiler is not None:
+            self.profiler.count('bytes_decompressed', len(data))
+        cut = max(self.position - self.lookback - self.output_start, 0)
+        self.output = self.output[cut:] + data
+        self.output_start += cut
+        end = self.output_start + len(self.output)
+        if hasattr(self.decompressor, 'copy') and end >= self.checkpoints[-1][0] + self.checkpoint_interval:
+            self.checkpoints.append((end, self.file.tell(), self.decompressor.copy()))
+        return True
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        while self.position >= self.output_start + len(self.output):
+            if not self.fill():
+                return 0
+        start = self.position - self.output_start
+        count = min(len(b), len(self.output) - start)
+        b[:count] = memoryview(self.output)[start:start + count]
+        self.position += count
+        return count
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.get_size()
+        if offset < 0:
+            raise ValueError("Negative seek position " + str(offset))
+        end = self.output_start + len(self.output)
+        if self.output_start <= offset <= end:
+            self.position = offset
+            return offset
+        checkpoint = self.checkpoints[bisect.bisect_right([item[0] for item in self.checkpoints], offset) - 1]
+        if offset < self.output_start or checkpoint[0] > end:
+            self.restore(checkpoint)
+        # decompressed data before the offset is dropped
+        while self.output_start + len(self.output) < offset:
+            self.position = self.output_start + len(self.output)
+            if not self.fill():
+                break
+        self.position = min(offset, self.output_start + len(self.output))
+        return self.position
+
+    def get_size(self):
+        """
+        :return: int: decompressed size, the stream is decompressed to its end once
+        """
+        if self.size is None:
+            position = self.position
+            while True:
+                self.position = self.output_start + len(self.output)
+                if not self.fill():
+                    break
+            self.seek(position)
+        return self.size
+
+    def close(self):
+        if not self.closed:
+            self.file.close()
+        super().close()
+
+
+class FSVRCompressedMap:
+    """
+    Read-only view of a decompressed stream from an offset with find() and slicing of mmap.mmap and absolute
+    offsets, data is decompressed as far as the searches need it and kept while the view is used
+    """
+    stream = None  #: FSVRCompressedFile: decompressed stream
+
+    def __init__(self, stream, offset):
+        """
+        :param stream: FSVRCompressedFile: decompressed stream, moved to the offset
+        :param offset: int: first byte used through the view
+        """
+        self.stream = stream
+        stream.seek(offset)
+
+    def find(self, sub, start=0):
+        """
+        :param sub: bytes: searched bytes
+        :param start: int: offset to search from
+        :return: int: offset of the first occurrence, -1 if there is none up to the end of the stream
+        """
+        stream = self.stream
+        while True:
+            found = stream.output.find(sub, max(start - stream.output_start, 0))
+            if found >= 0:
+                return stream.output_start + found
+            end = stream.output_start + len(stream.output)
+            if not stream.fill():
+                return -1
+            # only the new data and a possibly split occurrence are searched again
+            start = max(start, end - len(sub) + 1)
+
+    def __getitem__(self, key):
+        return self.stream.output[key.start - self.stream.output_start:key.stop - self.stream.output_start]
+
+    def __len__(self):
+        return self.stream.output_start + len(self.stream.output)
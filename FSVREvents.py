@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Igor Kim
+E-mail: igor.skh@gmail.com
+Repository: https://bitbucket.org/igorkim/fsvrreader
+
+Event statistics module for R&S FSVR Signal Analyzer DAT files
+
+April 2017
+"""
+import csv
+import numpy as np
+
+
+class FSVREvents:
+    """
+    Inter-arrival times, burst and idle durations of channel activity calculated from frame timestamps,
+    distributions are kept as binned CDFs or quantile summaries
+    """
+    quantiles = (0.0, 0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99, 1.0)  #: tuple: default quantiles of summaries
+
+    @staticmethod
+    def get_intervals(timestamps, active):
+        """
+        Calculates event intervals, frames are ordered by their timestamps first
+        :param timestamps: list: frame timestamps
+        :param active: list: bool activity per frame, e.g. level over a threshold
+        :return: dict: {'inter_arrival': times between consecutive active frames,
+                 'burst_durations': durations of active periods, 'idle_durations': durations of idle periods},
+                 a period lasts until the first frame of the next period, the last one is extended by the
+                 median frame interval
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        active = np.asarray(active, dtype=bool)
+        # dump files store frames from the newest to the oldest one
+        order = np.argsort(timestamps, kind='stable')
+        timestamps = timestamps[order]
+        active = active[order]
+        result = {'inter_arrival': np.diff(timestamps[active])}
+        if len(timestamps) == 0:
+            result['burst_durations'] = np.empty(0)
+            result['idle_durations'] = np.empty(0)
+            return result
+        starts = np.concatenate(([0], np.flatnonzero(active[1:] != active[:-1]) + 1))
+        ends = np.concatenate((starts[1:], [len(timestamps)]))
+        step = np.median(np.diff(timestamps)) if len(timestamps) > 1 else 0.0
+        end_times = np.append(timestamps[ends[:-1]], timestamps[-1] + step)
+        durations = end_times - timestamps[starts]
+        result['burst_durations'] = durations[active[starts]]
+        result['idle_durations'] = durations[~active[starts]]
+        return result
+
+    @staticmethod
+    def get_cdf(values, bins=256):
+        """
+        Calculates empirical CDF on histogram bins, size does not depend on the number of values
+        :param values: list: values
+        :param bins: int or list: number of bins or bin edges, see numpy.histogram
+        :return: numpy.ndarray: upper edges of the bins
+                 numpy.ndarray: share of values up to the edge
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return np.empty(0), np.empty(0)
+        counts, edges = np.histogram(values, bins=bins)
+        return edges[1:], np.cumsum(counts) / len(values)
+
+    @staticmethod
+    def get_quantiles(values, quantiles=None):
+        """
+        :param values: list: values
+        :param quantiles: list: quantiles between 0 and 1, FSVREvents.quantiles if None
+        :return: dict: {quantile: value}, empty if there are no values
+        """
+        values = np.asarray(values, dtype=np.float64)
+        quantiles = FSVREvents.quantiles if quantiles is None else quantiles
+        if len(values) == 0:
+            return {}
+        return dict(zip(quantiles, np.quantile(values, quantiles).tolist()))
+
+    @staticmethod
+    def save_cdf(filename, intervals, bins=256):
+        """
+        Saves binned CDFs of all event intervals to CSV
+        :param filename: str: path to the CSV file
+        :param intervals: dict: result of get_intervals()
+        :param bins: int: number of bins
+        :return:
+        """
+        with open(filename, 'w', newline='') as csvfile:
+            spamwriter = csv.writer(csvfile, delimiter=';', quotechar='|', quoting=csv.QUOTE_MINIMAL)
+            spamwriter.writerow(["event", "count", "value", "cdf"])
+            for name, values in intervals.items():
+                edges, cdf = FSVREvents.get_cdf(values, bins)
+                for edge, share in zip(edges.tolist(), cdf.tolist()):
+                    spamwriter.writerow([name, len(values), edge, share])
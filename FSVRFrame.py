@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Igor Kim
+E-mail: igor.skh@gmail.com
+Repository: https://bitbucket.org/igorkim/fsvrreader
+
+Compact data frame module for R&S FSVR Signal Analyzer dump files
+
+April 2017
+"""
+from collections.abc import Mapping
+import numpy as np
+
+
+class FSVRFrameData(Mapping):
+    """
+    Read-only {frequency: level} view of a data frame, a drop-in for the Data dictionary of a frame
+    """
+    __slots__ = ('frequency', 'levels')
+
+    def __init__(self, frequency, levels):
+        """
+        :param frequency: numpy.ndarray: frequency axis
+        :param levels: numpy.ndarray: levels of the frame
+        """
+        self.frequency = frequency
+        self.levels = levels
+
+    def __getitem__(self, frequency):
+        # frequency axis is ascending, other axes are searched linearly
+        i = int(np.searchsorted(self.frequency, frequency))
+        if i >= len(self.frequency) or self.frequency[i] != frequency:
+            found = np.flatnonzero(self.frequency == frequency)
+            if len(found) == 0:
+                raise KeyError(frequency)
+            i = int(found[0])
+        return float(self.levels[i])
+
+    def __iter__(self):
+        return iter(self.frequency.tolist())
+
+    def __len__(self):
+        return len(self.frequency)
+
+    def __contains__(self, frequency):
+        return bool(np.any(self.frequency == frequency))
+
+    def keys(self):
+        """
+        :return: list: frequencies
+        """
+        return self.frequency.tolist()
+
+    def values(self):
+        """
+        :return: list: levels
+        """
+        return self.levels.tolist()
+
+    def items(self):
+        """
+        :return: list: (frequency, level) pairs
+        """
+        return list(zip(self.frequency.tolist(), self.levels.tolist()))
+
+
+class FSVRFrame(Mapping):
+    """
+    Data frame holding a reference to the frequency axis shared by all frames of a file, a level array
+    and numeric frame number and timestamp. Fields are also available by the keys of the frame dictionary
+    of read_frame(): 'Frame', 'Timestamp', 'Data' and 'Date', 'Time' if known
+    """
+    __slots__ = ('frame', 'timestamp', 'frequency', 'levels', 'date', 'time')
+
+    def __init__(self, frame, timestamp, frequency, levels, date=None, time=None):
+        """
+        :param frame: int: frame number
+        :param timestamp: float: timestamp
+        :param frequency: numpy.ndarray: frequency axis, shared by the frames and not modified
+        :param levels: numpy.ndarray: levels of the frame, e.g. a row of a level matrix, None if not read
+        :param date: str: frame date, e.g. 12.Apr 17
+        :param time: str: frame time, e.g. 17:55:58.470
+        """
+        self.frame = int(frame)
+        self.timestamp = float(timestamp)
+        self.frequency = frequency
+        self.levels = levels
+        self.date = date
+        self.time = time
+
+    @staticmethod
+    def get_shared_frequency(frequency, shared=None):
+        """
+        Returns the shared frequency axis if the frequencies are the same, otherwise a read-only copy of them
+        :param frequency: numpy.ndarray: frequency axis
+        :param shared: numpy.ndarray: frequency axis shared so far
+        :return: numpy.ndarray: read-only frequency axis
+        """
+        if shared is not None and (frequency is shared or np.array_equal(frequency, shared)):
+            return shared
+        frequency = np.array(frequency, dtype=np.float64)
+        frequency.flags.writeable = False
+        return frequency
+
+    @staticmethod
+    def from_matrix(matrix, i, frequency=None):
+        """
+        :param matrix: dict: frame matrix, see FSVRReader.read_block()
+        :param i: int: row of the frame
+        :param frequency: numpy.ndarray: shared frequency axis, frequencies of the matrix if None
+        :return: FSVRFrame: frame with the levels viewing the row of the matrix
+        """
+        return FSVRFrame(matrix['Frame'][i], matrix['Timestamp'][i],
+                         matrix['Frequency'] if frequency is None else frequency, matrix['Data'][i])
+
+    def get_data(self):
+        """
+        :return: FSVRFrameData: {frequency: level} view of the frame
+        """
+        return FSVRFrameData(self.frequency, self.levels)
+
+    def get_fields(self):
+        """
+        :return: list: available keys
+        """
+        fields = ['Frame', 'Timestamp'] if self.date is None else ['Frame', 'Date', 'Time', 'Timestamp']
+        return fields if self.levels is None else fields + ['Data']
+
+    def __getitem__(self, key):
+        if key == 'Frame':
+            return self.frame
+        if key == 'Timestamp':
+            return self.timestamp
+        if key == 'Data' and self.levels is not None:
+            return self.get_data()
+        if key == 'Date' and self.date is not None:
+            return self.date
+        if key == 'Time' and self.time is not None:
+            return self.time
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.get_fields())
+
+    def __len__(self):
+        return len(self.get_fields())
+
+    def __repr__(self):
+        return "FSVRFrame(frame=%d, timestamp=%f, values=%d)" % (self.frame, self.timestamp,
+                                                                 0 if self.levels is None else len(self.levels))
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Igor Kim
+E-mail: igor.skh@gmail.com
+Repository: https://bitbucket.org/igorkim/fsvrreader
+
+Synthetic DAT file generator for R&S FSVR Signal Analyzer
+
+April 2017
+"""
+import datetime
+import numpy as np
+
+
+class FSVRGenerator:
+    """
+    Writes synthetic dump files in the FSVR DAT layout read by FSVRReader: header lines ending
+    with Values and Frames, then frames of Frame, Timestamp and Values lines of freq;level;
+    """
+    frames = 1000  #: int: number of data frames
+    values = 691  #: int: number of points per frame
+    f_start = 2448200000.0  #: float: first frequency in Hz
+    f_span = 10000000.0  #: float: frequency span in Hz
+    sweep_time = 0.001  #: float: sweep time in seconds
+    frame_interval = 0.0156  #: float: time between frames in seconds
+    noise_level = -95.0  #: float: mean noise level in dBm
+    noise_deviation = 1.5  #: float: standard deviation of the noise in dB
+    signal_level = -45.0  #: float: level of an active carrier in dBm
+    occupancy = 0.2  #: float: share of frames with an active carrier
+    burst_length = 10.0  #: float: mean number of frames in a burst
+    band = (0.4, 0.6)  #: tuple: occupied part of the span as fractions (start, end)
+    seed = 0  #: int: random generator seed
+    block_frames = 1024  #: int: number of frames generated at once
+
+    def __init__(self, frames=1000, values=691, **kwargs):
+        """
+        :param frames: int: number of data frames
+        :param values: int: number of points per frame
+        :param kwargs: other generator attributes, e.g. f_span, occupancy, burst_length, band, seed
+        """
+        self.frames = frames
+        self.values = values
+        for key, value in kwargs.items():
+            if not hasattr(self, key):
+                raise AttributeError("Unknown generator parameter " + key)
+            setattr(self, key, value)
+
+    def get_frequencies(self):
+        """
+        :return: numpy.ndarray: frequency axis
+        """
+        return self.f_start + np.arange(self.values) * (self.f_span / max(self.values - 1, 1))
+
+    def get_header(self, start_time):
+        """
+        :param start_time: datetime: time of the first frame
+        :return: list: header lines
+        """
+        return ["Type;FSVR-13;", "Version;1.63;", "Date;" + start_time.strftime("%d.%b %y") + ";",
+                "Mode;REALTIME;SPECTROGRAM;", "Freq Offset;0.000000;Hz", "x-Axis;LIN;",
+                "Ref Level;-25.000000;dBm", "Level Offset;0.000000;dB", "Ref Position;100.000000;%",
+                "y-Axis;LOG;", "Level Range;50.000000;dB", "Rf Att;0.000000;dB", "El Att;0.000000;dB",
+                "RBW;50000.000000;Hz", "SWT;%f;s" % self.sweep_time, "Trace Mode;CLR/WRITE;",
+                "Detector;MAXPEAK;", "Sweep Count;0;", "Trace 1:;;", "x-Unit;Hz;", "y-Unit;dBm;",
+                "Preamplifier;OFF;", "Transducer;OFF;", "Values;%d;" % self.values, "Frames;%d;" % self.frames]
+
+    def generate_states(self, rng, count, state):
+        """
+        Generates carrier activity as a two state Markov chain with the configured occupancy and burst length
+        :param rng: numpy.random.Generator: random generator
+        :param count: int: number of frames
+        :param state: bool: activity of the previous frame
+        :return: numpy.ndarray: bool activity per frame
+        """
+        p_off = 1.0 / max(self.burst_length, 1.0)
+        p_on = p_off * self.occupancy / (1.0 - self.occupancy) if self.occupancy < 1 else 1.0
+        draws = rng.random(count)
+        result = np.empty(count, dtype=bool)
+        for i in range(count):
+            state = draws[i] < p_on if not state else draws[i] >= p_off
+            result[i] = state
+        return result
+
+    def write(self, filename, start_time=None):
+        """
+        Writes synthetic dump file, frames are stored from the newest to the oldest one as the device does
+        :param filename: str: path to the file
+        :param start_time: datetime: time of the newest frame, now if None
+        :return: str: path to the file
+        """
+        if start_time is None:
+            start_time = datetime.datetime.now()
+        rng = np.random.default_rng(self.seed)
+        # levels are quantized to 0.01 dB, so the value lines are joined from prepared strings
+        level_codes = np.arange(-20000, 2001)
+        level_strings = np.array(["%.2f;\r\n" % (code / 100) for code in level_codes], dtype=object)
+        prefixes = np.array(["%.0f;" % f for f in self.get_frequencies()], dtype=object)
+        bins = np.arange(self.values)
+        carrier = (bins >= int(self.band[0] * self.values)) & (bins < int(self.band[1] * self.values))
+        state = False
+        with open(filename, "w", newline="") as fout:
+            fout.write("\r\n".join(self.get_header(start_time)) + "\r\n")
+            for block_start in range(0, self.frames, self.block_frames):
+                count = min(self.block_frames, self.frames - block_start)
+                states = self.generate_states(rng, count, state)
+                state = bool(states[-1]) if count > 0 else state
+                levels = rng.normal(self.noise_level, self.noise_deviation, (count, self.values))
+                levels[np.ix_(states, carrier)] += self.signal_level - self.noise_level
+                codes = np.clip(np.round(levels * 100).astype(np.int64), level_codes[0], level_codes[-1])
+                lines = prefixes + level_strings[codes - level_codes[0]]
+                for i in range(count):
+                    n = block_start + i
+                    ts = start_time - datetime.timedelta(seconds=n * self.frame_interval)
+                    fout.write("Frame;%d;\r\nTimestamp;%s;%s\r\n" % (-n, ts.strftime("%d.%b %y"),
+                                                                     ts.strftime("%H:%M:%S.%f")[:-3]))
+                    fout.write("".join(lines[i]))
+        return filename
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Igor Kim
+E-mail: igor.skh@gmail.com
+Repository: https://bitbucket.org/igorkim/fsvrreader
+
+Instrumentation module for the reader and analysis modules
+
+April 2017
+"""
+from contextlib import contextmanager
+import cProfile
+import functools
+import io
+import json
+import pstats
+import time
+
+
+class FSVRProfiler:
+    """
+    Per-stage timers and counters of the reader and analysis modules, cheap enough to stay enabled.
+    Timers and counters are aggregated per name, callbacks receive every finished stage
+    """
+    enabled = True  #: bool: collect timers and counters
+    timers = None  #: dict: {stage: [number of calls, total seconds]}
+    counters = None  #: dict: {counter: value}
+    callbacks = None  #: list: functions called as callback(stage, seconds) when a stage finishes
+    profiles = None  #: dict: {method name: cProfile.Profile} of the methods profiled with profile()
+
+    def __init__(self, enabled=True):
+        """
+        :param enabled: bool: collect timers and counters
+        """
+        self.enabled = enabled
+        self.callbacks = []
+        self.profiles = {}
+        self.reset()
+
+    def reset(self):
+        """
+        Clears timers, counters and profiles
+        :return:
+        """
+        self.timers = {}
+        self.counters = {}
+        self.profiles = {}
+
+    def add_callback(self, callback):
+        """
+        Registers a function called as callback(stage, seconds) when a stage finishes
+        :param callback: function
+        :return:
+        """
+        self.callbacks.append(callback)
+
+    def count(self, name, value=1):
+        """
+        Increments a counter
+        :param name: str: counter name
+        :param value: int: increment
+        :return:
+        """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_time(self, name, seconds):
+        """
+        Adds time to a stage timer and notifies the callbacks
+        :param name: str: stage name
+        :param seconds: float: elapsed time
+        :return:
+        """
+        if not self.enabled:
+            return
+        timer = self.timers.setdefault(name, [0, 0.0])
+        timer[0] += 1
+        timer[1] += seconds
+        for callback in self.callbacks:
+            callback(name, seconds)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Context manager measuring time of a stage
+        :param name: str: stage name
+        :return:
+        """
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    @staticmethod
+    def timed(name):
+        """
+        Decorator measuring time of a method of an object with a profiler attribute
+        :param name: str: stage name
+        :return: function: decorator
+        """
+        def decorator(method):
+            @functools.wraps(method)
+            def wrapper(self, *args, **kwargs):
+                profiler = getattr(self, 'profiler', None)
+                if profiler is None or not profiler.enabled:
+                    return method(self, *args, **kwargs)
+                with profiler.stage(name):
+                    return method(self, *args, **kwargs)
+            return wrapper
+        return decorator
+
+    def profile(self, obj, *names):
+        """
+        Opt-in cProfile of methods of an object, calls of each method are accumulated in profiles
+        :param obj: object: reader or analyzer object
+        :param names: str: method names
+        :return:
+        """
+        for name in names:
+            method = getattr(obj, name)
+            profile = self.profiles.setdefault(name, cProfile.Profile())
+
+            def wrapper(*args, _method=method, _profile=profile, **kwargs):
+                return _profile.runcall(_method, *args, **kwargs)
+            setattr(obj, name, functools.wraps(method)(wrapper))
+
+    def get_profile_report(self, name, limit=20, sort='cumulative'):
+        """
+        :param name: str: profiled method name
+        :param limit: int: number of functions in the report
+        :param sort: str: pstats sort key
+        :return: str: pstats report of a profiled method
+        """
+        stream = io.StringIO()
+        pstats.Stats(self.profiles[name], stream=stream).sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def to_dict(self):
+        """
+        :return: dict: {'timers': {stage: {'calls', 'seconds'}}, 'counters': {counter: value}}
+        """
+        return {'timers': {name: {'calls': timer[0], 'seconds': timer[1]} for name, timer in self.timers.items()},
+                'counters': dict(self.counters)}
+
+    def to_json(self, filename=None):
+        """
+        Exports timers and counters as JSON
+        :param filename: str: path to the JSON file, nothing is saved if None
+        :return: str: JSON string
+        """
+        result = json.dumps(self.to_dict(), indent=2)
+        if filename is not None:
+            with open(filename, 'w') as fout:
+                fout.write(result)
+        return result
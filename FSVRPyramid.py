@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Igor Kim
+E-mail: igor.skh@gmail.com
+Repository: https://bitbucket.org/igorkim/fsvrreader
+
+Multi-resolution level pyramid module for waterfall plots of R&S FSVR Signal Analyzer dump files
+
+April 2017
+"""
+import os
+import numpy as np
+
+
+class FSVRPyramid:
+    """
+    Pyramid of frames x frequencies level tiles. Level n reduces groups of 2^n frames and of bin_factors[n] bins
+    of the frame matrix to their maximum and mean, level 0 is the frame matrix itself and is not stored.
+    Levels are built in one pass over blocks of frames and appended to raw float32 files which are memory-mapped
+    on reading, so reading a range of a level touches only the bytes of that range
+    """
+    folder = ""  #: str: folder of the pyramid files
+    max_bins = 1024  #: int: bins of a level are halved until there are no more of them
+    min_frames = 256  #: int: levels are added until the coarsest one has no more frames
+    block_frames = 4096  #: int: number of frames reduced at once while building
+    frames = 0  #: int: number of frames of the frame matrix
+    values = 0  #: int: number of bins of the frame matrix
+    bin_factors = None  #: list: number of bins reduced to one bin on each level
+    frequency = None  #: numpy.ndarray: frequency axis of the frame matrix
+    timestamps = None  #: numpy.ndarray: timestamps of the frames
+    signature = None  #: tuple: signature of the source the pyramid was built from
+
+    def __init__(self, folder, max_bins=1024, min_frames=256):
+        """
+        :param folder: str: folder of the pyramid files
+        :param max_bins: int: bins of a level are halved until there are no more of them
+        :param min_frames: int: levels are added until the coarsest one has no more frames
+        """
+        self.folder = folder
+        self.max_bins = max_bins
+        self.min_frames = min_frames
+        self.bin_factors = [1]
+
+    def get_level_path(self, level, mode):
+        """
+        :param level: int: pyramid level starting from 1
+        :param mode: str: 'max' or 'mean'
+        :return: str: path to the level file
+        """
+        return os.path.join(self.folder, "level_%d_%s.bin" % (level, mode))
+
+    def get_meta_path(self):
+        """
+        :return: str: path to the metadata file of the pyramid
+        """
+        return os.path.join(self.folder, "meta.npz")
+
+    def get_levels(self):
+        """
+        :return: int: number of stored levels
+        """
+        return len(self.bin_factors) - 1
+
+    def get_shape(self, level):
+        """
+        :param level: int: pyramid level
+        :return: tuple: (frames, bins) of the level
+        """
+        return -(-self.frames // 2 ** level), -(-self.values // self.bin_factors[level])
+
+    def plan(self, frames, values):
+        """
+        Calculates bin reduction of the levels for a frame matrix
+        :param frames: int: number of frames
+        :param values: int: number of bins
+        :return: list: number of bins reduced to one bin on each level
+        """
+        self.frames = frames
+        self.values = values
+        self.bin_factors = [1]
+        while -(-frames // 2 ** (len(self.bin_factors) - 1)) > self.min_frames or \
+                -(-values // self.bin_factors[-1]) > self.max_bins:
+            factor = self.bin_factors[-1]
+            self.bin_factors.append(factor * 2 if -(-values // factor) > self.max_bins else factor)
+        return self.bin_factors
+
+    def build(self, read_block, frames, signature=None):
+        """
+        Builds and saves the levels from blocks of frames, memory depends on block_frames only
+        :param read_block: function: read_block(count) returns the next frame matrix, see FSVRReader.read_block()
+        :param frames: int: number of frames to read
+        :param signature: tuple: signature of the source saved with the pyramid, see load()
+        :return: int: number of stored levels
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        block = read_block(min(self.block_frames, frames))
+        self.plan(frames, block['Data'].shape[1])
+        levels = self.get_levels()
+        # blocks are aligned to the coarsest level, so frame groups never cross blocks
+        step = -(-self.block_frames // 2 ** levels) * 2 ** levels
+        # rows of every level are produced in order and appended, nothing but the block stays in memory
+        files = {(level, mode): open(self.get_level_path(level, mode) + ".tmp", "wb")
+                 for level in range(1, levels + 1) for mode in ('max', 'mean')}
+        self.frequency = block['Frequency']
+        timestamps = []
+        position = 0
+        while position < frames:
+            if position > 0:
+                block = read_block(min(step, frames - position))
+            elif len(block['Frame']) < min(step, frames):
+                rest = read_block(min(step, frames) - len(block['Frame']))
+                block = {key: np.concatenate((block[key], rest[key])) if key != 'Frequency' else block[key]
+                         for key in block} if len(rest['Frame']) > 0 else block
+            if len(block['Frame']) == 0:
+                break
+            timestamps.append(block['Timestamp'])
+            maximum = np.asarray(block['Data'], dtype=np.float64)
+            total = maximum
+            row_counts = np.ones(len(maximum))
+            bin_counts = np.ones(maximum.shape[1])
+            for level in range(1, levels + 1):
+                rows = np.arange(0, len(maximum), 2)
+                maximum = np.maximum.reduceat(maximum, rows, axis=0)
+                total = np.add.reduceat(total, rows, axis=0)
+                row_counts = np.add.reduceat(row_counts, rows)
+                if self.bin_factors[level] > self.bin_factors[level - 1]:
+                    bins = np.arange(0, maximum.shape[1], 2)
+                    maximum = np.maximum.reduceat(maximum, bins, axis=1)
+                    total = np.add.reduceat(total, bins, axis=1)
+                    bin_counts = np.add.reduceat(bin_counts, bins)
+                files[(level, 'max')].write(maximum.astype(np.float32).tobytes())
+                files[(level, 'mean')].write((total / np.outer(row_counts, bin_counts)).astype(np.float32).tobytes())
+            position += len(block['Frame'])
+        for key in list(files):
+            files.pop(key).close()
+        for level in range(1, levels + 1):
+            for mode in ('max', 'mean'):
+                os.replace(self.get_level_path(level, mode) + ".tmp", self.get_level_path(level, mode))
+        self.frames = position
+        self.timestamps = np.concatenate(timestamps) if len(timestamps) > 0 else np.empty(0)
+        self.signature = signature
+        with open(self.get_meta_path() + ".tmp", "wb") as fout:
+            np.savez(fout, Frequency=self.frequency, Timestamp=self.timestamps, BinFactors=np.array(self.bin_factors),
+                     Shape=np.array([self.frames, self.values]), MaxBins=self.max_bins, MinFrames=self.min_frames,
+                     Signature=np.array(signature if signature is not None else [], dtype=np.int64))
+        os.replace(self.get_meta_path() + ".tmp", self.get_meta_path())
+        return levels
+
+    def load(self, signature=None):
+        """
+        Loads the saved pyramid if it was built from the same source with the same settings
+        :param signature: tuple: signature of the source, e.g. (size, modification time)
+        :return: bool: True if the pyramid is loaded, False otherwise
+        """
+        if not os.path.isfile(self.get_meta_path()):
+            return False
+        try:
+            with np.load(self.get_meta_path()) as meta:
+                if tuple(meta['Signature'].tolist()) != tuple(signature or ()) or \
+                        int(meta['MaxBins']) != self.max_bins or int(meta['MinFrames']) != self.min_frames:
+                    return False
+                self.frequency = meta['Frequency']
+                self.timestamps = meta['Timestamp']
+                self.bin_factors = meta['BinFactors'].tolist()
+                self.frames, self.values = meta['Shape'].tolist()
+        except (OSError, ValueError, KeyError):
+            return False
+        self.signature = signature
+        return all(os.path.isfile(self.get_level_path(level, mode))
+                   for level in range(1, self.get_levels() + 1) for mode in ('max', 'mean'))
+
+    def select_level(self, frames, bins, height, width):
+        """
+        Selects the finest level which fits a range into the given resolution
+        :param frames: int: number of frames in the range
+        :param bins: int: number of bins in the range
+        :param height: int: maximal number of rows
+        :param width: int: maximal number of columns
+        :return: int: pyramid level, 0 if the frame matrix itself fits
+        """
+        for level in range(self.get_levels() + 1):
+            # bins of the level are reduced further to the width by get_tile() if no level stores fewer of them
+            if -(-frames // 2 ** level) <= height and (-(-bins // self.bin_factors[level]) <= width or
+                                                       self.bin_factors[level] == self.bin_factors[-1]):
+                return level
+        return self.get_levels()
+
+    @staticmethod
+    def reduce_columns(tile, width, mode='max', counts=None):
+        """
+        Reduces groups of neighbouring columns of a tile to their maximum or mean, so it has at most width columns
+        :param tile: dict: tile, see get_tile()
+        :param width: int: maximal number of columns
+        :param mode: str: 'max' or 'mean'
+        :param counts: numpy.ndarray: number of frame matrix bins in each column, weights of the mean, 1 if None
+        :return: dict: tile with the reduced columns
+        """
+        columns = tile['Data'].shape[1]
+        if columns <= width:
+            return tile
+        groups = np.arange(0, columns, -(-columns // width))
+        if mode == 'max':
+            data = np.maximum.reduceat(tile['Data'], groups, axis=1)
+        else:
+            counts = np.ones(columns) if counts is None else counts
+            data = np.add.reduceat(tile['Data'] * counts, groups, axis=1) / np.add.reduceat(counts, groups)
+        return dict(tile, Data=data, Frequency=tile['Frequency'][groups])
+
+    def get_tile(self, level, start=0, stop=None, b_start=0, b_stop=None, mode='max', width=None):
+        """
+        Reads a range of a stored level, only the rows of the range are read from the level file
+        :param level: int: pyramid level starting from 1
+        :param start: int: first frame of the range
+        :param stop: int: frame after the last one of the range, all frames if None
+        :param b_start: int: first bin of the range
+        :param b_stop: int: bin after the last one of the range, all bins if None
+        :param mode: str: 'max' or 'mean'
+        :param width: int: maximal number of columns, see reduce_columns(), all columns of the level if None
+        :return: dict: {'Data': rows x columns array of levels, 'Timestamp': timestamps of the first frames of the rows,
+                 'Frequency': frequencies of the first bins of the columns}
+        """
+        if not 1 <= level <= self.get_levels():
+            raise IndexError("Level " + str(level) + " is not stored")
+        stop = self.frames if stop is None else min(stop, self.frames)
+        b_stop = self.values if b_stop is None else min(b_stop, self.values)
+        rows = slice(start // 2 ** level, -(-stop // 2 ** level))
+        columns = slice(b_start // self.bin_factors[level], -(-b_stop // self.bin_factors[level]))
+        data = np.memmap(self.get_level_path(level, mode), dtype=np.float32, mode='r', shape=self.get_shape(level))
+        tile = {'Data': np.array(data[rows, columns]),
+                'Timestamp': self.timestamps[::2 ** level][rows],
+                'Frequency': self.frequency[::self.bin_factors[level]][columns]}
+        if width is None:
+            return tile
+        # the last column of the level may cover fewer bins
+        first = np.arange(columns.start, columns.stop) * self.bin_factors[level]
+        return self.reduce_columns(tile, width, mode, np.minimum(first + self.bin_factors[level], self.values) - first)
@@ -10,23 +10,66 @@ April 2017
 """
 
 import os.path
+import io
 import datetime
+import json
+import mmap
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from time import perf_counter, monotonic, sleep
+import numpy as np
+from FSVRProfiler import FSVRProfiler
+from FSVRFrame import FSVRFrame
+from FSVRCompressedFile import FSVRCompressedFile, FSVRCompressedMap
 
 
 class FSVRReader:
     """
-    Reader module implementation for reading R&S FSVR Signal Analyzer dump files
+    Reader module implementation for reading R&S FSVR Signal Analyzer dump files.
+    All state is kept per object, readers of different files can be used in parallel threads,
+    a reader shared by threads serializes the methods which move its file pointer with its lock
     """
     file_path = ""  #: object: path to the file
-    last_frame = {}  #: dict: last data frame data
+    last_frame = {}  #: FSVRFrame: last data frame data
     header_end = 0  #: int: byte where the header ends
     file = None  #: object: file object
     header = {}  #: dict: header dictionary
+    use_sidecar = False  #: bool: keep a binary sidecar copy of the frames next to the dat file
+    sidecar = None  #: dict: memory-mapped frame matrix loaded from the sidecar
+    index = None  #: dict: frame index {'Offset': byte offsets, 'Frame': frame numbers, 'Timestamp': timestamps}
+    persist_index = True  #: bool: save frame index next to the dat file
+    hour_timestamps = {}  #: dict: timestamps of the (date, hour) pairs decoded so far, shared by all readers
+    processes = 1  #: int: number of processes parsing frames in read_matrix()
+    min_chunk_frames = 256  #: int: minimal number of frames parsed by one process
+    profiler = None  #: FSVRProfiler: timers and counters of the reader stages
+    frequency = None  #: numpy.ndarray: read-only frequency axis shared by the frames read so far
+    backend = 'mmap'  #: str: frame parser of read_block(), 'mmap' converts memory-mapped blocks, 'text' reads lines
+    compression = None  #: str: compression of the file, 'gzip', 'bz2', 'xz', 'zlib', 'zstd' or None if not compressed
+    mapped_frames = 256  #: int: number of frames converted at once by the mmap backend
+    powers_of_ten = 10.0 ** np.arange(23)  #: numpy.ndarray: powers of ten exactly representable as float64
+    lock = None  #: threading.RLock: held by the methods reading ranges of frames, see read_matrix()
+    mapping = None  #: mmap.mmap: map of the whole file kept from reopen_file() to close(), see get_mapping()
+    signature = None  #: tuple: (size, modification time in ns) of the file when it was reopened
+    frame_buffer = None  #: list: [frame matrix, frame records, next row, file offset] of read_frame() blocks
 
-    def __init__(self, filename=None):
+    def __init__(self, filename=None, sidecar=False, processes=1, backend='mmap'):
         """
         :param filename: path to the dat file
+        :param sidecar: bool: write and use binary sidecar files, see reopen_file()
+        :param processes: int: number of processes parsing frames, see read_matrix_parallel()
+        :param backend: str: frame parser, 'mmap' or 'text', see read_block()
         """
+        if backend not in ('mmap', 'text'):
+            raise ValueError("Unknown backend " + str(backend))
+        self.header = {}
+        self.last_frame = {}
+        self.lock = threading.RLock()
+        self.use_sidecar = sidecar
+        self.processes = processes
+        self.backend = backend
+        self.profiler = FSVRProfiler()
         if filename is not None:
             self.reopen_file(filename)
         # if os.path.isfile(filename):
@@ -87,6 +130,8 @@ class FSVRReader:
         """
         if self.file is None:
             raise RuntimeError("File has not been initialized")
+        # a new dictionary, headers returned before are not changed
+        self.header = {}
         for i in range(limit):
             values = self.read_line().rstrip().split(";")
             self.header[values[0]] = values[1:]
@@ -102,51 +147,1095 @@ class FSVRReader:
         """
         return self.file_path
 
-    def reopen_file(self, filename=None):
-        """ Reopens file to the position of first frame, skips header
+    def reopen_file(self, filename=None, sidecar=None):
+        """ Reopens file to the position of first frame, skips header.
+        Compressed files are decompressed while reading, see FSVRCompressedFile, the decompressed stream
+        and its checkpoints are kept between reopens of an unchanged file.
+        With sidecar enabled the frames are kept in binary files next to the dat file,
+        <file>.levels.npy and <file>.meta.npz, which are memory-mapped on the later opens
+        while size and modification time of the dat file are unchanged
+        :param filename: path to the dat file, current file if None
+        :param sidecar: bool: write and use binary sidecar files, current setting if None
         :return: object: File object
         """
         # if not new file_path provided reopen current file
         if filename is None:
             filename = self.file_path
-        if self.file is not None:
-            self.file.close()
+        if sidecar is not None:
+            self.use_sidecar = sidecar
         if os.path.isfile(filename):
+            self.profiler.count('reopens')
+            self.release_mapping()
+            self.frame_buffer = None
+            signature = self.get_file_signature(filename)
+            if filename != self.file_path or signature != self.signature:
+                # frequencies of another or rewritten file are converted again
+                self.frequency = None
+            self.signature = signature
+            compression = FSVRCompressedFile.get_compression(filename)
+            stream = self.file.buffer.raw if self.file is not None and self.compression is not None else None
+            if stream is not None and stream.filename == filename and stream.signature == signature:
+                # the decompressed stream is rewound, later seeks use the checkpoints collected so far
+                self.file.seek(0)
+            else:
+                if self.file is not None:
+                    self.file.close()
+                self.file = open(filename, "r") if compression is None else \
+                    FSVRCompressedFile.open_text(filename, compression, self.profiler)
             self.file_path = filename
-            self.file = open(filename, "r")
-            self.read_header()
+            self.compression = compression
+            with self.profiler.stage('read_header'):
+                self.read_header()
+            self.sidecar = self.load_sidecar() if self.use_sidecar else None
+            if self.index is not None and self.index['Signature'] != signature:
+                self.index = None
         else:
             raise FileNotFoundError("File " + filename + " does not exist")
         return self.file
 
+    def close(self):
+        """
+        Closes the file, reopen_file() opens it again
+        :return:
+        """
+        with self.lock:
+            self.release_mapping()
+            self.frame_buffer = None
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def get_mapping(self, refresh=False):
+        """
+        Maps the whole file once, the map is kept until reopen_file() or close()
+        :param refresh: bool: map the file again if its size has changed since it was mapped
+        :return: mmap.mmap: read-only map of the file
+        """
+        if self.mapping is not None and refresh and os.path.getsize(self.file_path) != len(self.mapping):
+            self.release_mapping()
+        if self.mapping is None:
+            with open(self.file_path, "rb") as fin:
+                self.mapping = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+            self.profiler.count('maps')
+        return self.mapping
+
+    def release_mapping(self):
+        """
+        Unmaps the file, see get_mapping()
+        :return:
+        """
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_sidecar_paths(self):
+        """
+        :return: tuple: (levels file path, metadata file path) of the binary sidecar
+        """
+        return self.file_path + ".levels.npy", self.file_path + ".meta.npz"
+
+    def get_file_signature(self, filename=None):
+        """
+        :param filename: str: path to the file, the dat file if None
+        :return: tuple: (size, modification time in ns) of the dat file
+        """
+        stat = os.stat(self.file_path if filename is None else filename)
+        return stat.st_size, stat.st_mtime_ns
+
+    def load_sidecar(self):
+        """
+        Memory-maps the binary sidecar if it is up to date with the dat file
+        :return: dict: frame matrix, see read_block(), None if there is no valid sidecar
+        """
+        levels_path, meta_path = self.get_sidecar_paths()
+        if not os.path.isfile(levels_path) or not os.path.isfile(meta_path):
+            return None
+        try:
+            with np.load(meta_path) as meta:
+                if tuple(meta['Signature'].tolist()) != self.get_file_signature() or \
+                        json.loads(str(meta['Header'])) != self.header:
+                    return None
+                matrix = {'Frequency': meta['Frequency'], 'Timestamp': meta['Timestamp'], 'Frame': meta['Frame']}
+            matrix['Data'] = np.load(levels_path, mmap_mode='r')
+        except (OSError, ValueError, KeyError):
+            # broken sidecar is ignored and rewritten on the next cold read
+            return None
+        if len(matrix['Data']) != len(matrix['Frame']):
+            return None
+        return matrix
+
+    def save_sidecar(self, matrix):
+        """
+        Writes frame matrix of the whole file to the binary sidecar
+        :param matrix: dict: frame matrix, see read_block()
+        :return: 
+        """
+        levels_path, meta_path = self.get_sidecar_paths()
+        signature = self.get_file_signature()
+        # write to temporary files first, so a broken write never looks like a valid sidecar
+        with open(levels_path + ".tmp", "wb") as fout:
+            np.save(fout, matrix['Data'])
+        with open(meta_path + ".tmp", "wb") as fout:
+            np.savez(fout, Frequency=matrix['Frequency'], Timestamp=matrix['Timestamp'], Frame=matrix['Frame'],
+                     Signature=np.array(signature, dtype=np.int64), Header=np.array(json.dumps(self.header)))
+        os.replace(levels_path + ".tmp", levels_path)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    @classmethod
+    def get_hour_timestamp(cls, date, hour):
+        """
+        Returns local time timestamp of the beginning of an hour, results are cached,
+        the date is parsed only once per distinct day and hour
+        :param date: str: frame date, e.g. 12.Apr 17
+        :param hour: int: hour of the day
+        :return: int: timestamp
+        """
+        key = (date, hour)
+        if key not in cls.hour_timestamps:
+            hour_start = datetime.datetime.strptime(date + "T" + str(hour), "%d.%b %yT%H")
+            cls.hour_timestamps[key] = int(hour_start.timestamp())
+        return cls.hour_timestamps[key]
+
+    @classmethod
+    def parse_timestamp(cls, date, time):
+        """
+        Converts frame date and time strings to a local time timestamp,
+        HH:MM:SS.ffffff time is decoded arithmetically on top of the cached hour timestamp
+        :param date: str: frame date, e.g. 12.Apr 17
+        :param time: str: frame time, e.g. 17:55:58.470
+        :return: float: timestamp
+        """
+        if len(time) < 10 or len(time) > 15 or time[2] != ":" or time[5] != ":" or time[8] != "." \
+                or not time[9:].isdigit():
+            return datetime.datetime.strptime(date + "T" + time, "%d.%b %yT%H:%M:%S.%f").timestamp()
+        minute = int(time[3:5])
+        second = int(time[6:8])
+        if minute > 59 or second > 61:
+            return datetime.datetime.strptime(date + "T" + time, "%d.%b %yT%H:%M:%S.%f").timestamp()
+        # the fraction is in microseconds the same way strptime %f does it
+        microsecond = int(time[9:].ljust(6, "0"))
+        return cls.get_hour_timestamp(date, int(time[0:2])) + minute*60 + second + microsecond / 1e6
+
+    @classmethod
+    def parse_timestamps(cls, dates, times):
+        """
+        Converts columns of frame dates and times to local time timestamps in bulk
+        :param dates: list: frame dates, e.g. 12.Apr 17
+        :param times: list: frame times, e.g. 17:55:58.470
+        :return: numpy.ndarray: float64 timestamps
+        """
+        times = np.asarray(times, dtype=str)
+        if len(times) == 0:
+            return np.empty(0)
+        width = times.dtype.itemsize // 4
+        # fixed width HH:MM:SS.fff columns are decoded from character codes
+        if 10 <= width <= 15 and np.all(np.char.str_len(times) == width):
+            codes = times.view(np.uint32).reshape(len(times), width).astype(np.int64)
+            digits = codes - ord("0")
+            separators = (codes[:, 2] == ord(":")) & (codes[:, 5] == ord(":")) & (codes[:, 8] == ord("."))
+            numeric = np.delete(digits, [2, 5, 8], axis=1)
+            minutes = digits[:, 3]*10 + digits[:, 4]
+            seconds = digits[:, 6]*10 + digits[:, 7]
+            if np.all(separators) and np.all((numeric >= 0) & (numeric <= 9)) and \
+                    np.all(minutes <= 59) and np.all(seconds <= 61):
+                hours = digits[:, 0]*10 + digits[:, 1]
+                microseconds = digits[:, 9:].dot(10 ** np.arange(5, 14 - width, -1))
+                # the hour timestamp is evaluated once per distinct date and hour
+                unique_dates, date_idx = np.unique(np.asarray(dates, dtype=str), return_inverse=True)
+                pairs, pair_idx = np.unique(date_idx.reshape(-1)*24 + hours, return_inverse=True)
+                hour_timestamps = np.array([cls.get_hour_timestamp(str(unique_dates[pair // 24]), int(pair % 24))
+                                            for pair in pairs], dtype=np.int64)
+                whole = hour_timestamps[pair_idx.reshape(-1)] + minutes*60 + seconds
+                return whole.astype(np.float64) + microseconds / 1e6
+        return np.array([cls.parse_timestamp(date, time) for date, time in zip(dates, times)], dtype=np.float64)
+
     def read_frame(self):
         """
         Reads next frame
-        :return: dict: frame data
+        :return: FSVRFrame: frame data, fields are also available as frame['Frame'], frame['Timestamp'], frame['Data']
         """
         if self.file is None:
             raise RuntimeError("File has not been initialized")
         if len(self.header) == 0:
             raise RuntimeError("Header has not been initialized")
-        frame = {}
-        frame_data = {}
+        if self.backend == 'mmap':
+            return self.read_buffered_frame()
+        start = perf_counter()
         # read the number provided by Values number in the header
-        for i in range(int(self.header['Values'][0])+2):
-            values = self.read_line().rstrip().split(";")
+        lines = [self.read_line() for i in range(int(self.header['Values'][0])+2)]
+        # stop on the end of file or on an incomplete frame the same way the mmap backend does
+        if not lines[-1]:
+            raise EOFError("No complete frame left in the file")
+        read_time = perf_counter()
+        timestamp_time = 0.0
+        frame = {}
+        frequency = []
+        levels = []
+        for line in lines:
+            values = line.rstrip().split(";")
             # for the frame header data
             if values[0] in ['Frame', 'Timestamp']:
                 # evaluate timestamp
                 if values[0] == 'Timestamp':
                     frame['Date'] = values[1]
                     frame['Time'] = values[2]
+                    timestamp_start = perf_counter()
                     # example time 12.Apr 17;17:55:58.470
-                    frame['Timestamp'] = datetime.datetime.strptime(frame['Date']+"T"+frame['Time'], "%d.%b %yT%H:%M:%S.%f").timestamp()
+                    frame['Timestamp'] = self.parse_timestamp(frame['Date'], frame['Time'])
+                    timestamp_time += perf_counter() - timestamp_start
                 else:
                     frame[values[0]] = values[1]
             # for values
             else:
-                frame_data[float(values[0])] = float(values[1])
-        frame['Data'] = frame_data
-        self.last_frame = frame
+                frequency.append(float(values[0]))
+                levels.append(float(values[1]))
+        self.last_frame = FSVRFrame(int(frame['Frame']), frame['Timestamp'], self.get_shared_frequency(frequency),
+                                    np.array(levels), frame['Date'], frame['Time'])
+        self.profiler.add_time('read_lines', read_time - start)
+        self.profiler.add_time('decode_timestamps', timestamp_time)
+        self.profiler.add_time('convert_values', perf_counter() - read_time - timestamp_time)
+        self.profiler.count('lines_read', len(lines))
+        self.profiler.count('bytes_read', sum(map(len, lines)))
+        self.profiler.count('frames_decoded')
+
+        return self.last_frame
+
+    def read_buffered_frame(self):
+        """
+        Reads next frame of the mmap backend, frames are converted in blocks of mapped_frames and returned one by one.
+        The file pointer is moved after the returned frame, so other reads continue from there and a moved
+        file pointer starts a new block
+        :return: FSVRFrame: frame data
+        """
+        buffer = self.frame_buffer
+        if buffer is None or buffer[2] >= len(buffer[1]) or self.file.tell() != buffer[3]:
+            records = []
+            matrix = self.read_mapped_block(self.mapped_frames, records=records)
+            if len(records) == 0:
+                self.frame_buffer = None
+                raise EOFError("No complete frame left in the file")
+            buffer = self.frame_buffer = [matrix, records, 0, None]
+        matrix, records, row = buffer[:3]
+        end, date, time = records[row]
+        self.last_frame = FSVRFrame(matrix['Frame'][row], matrix['Timestamp'][row], matrix['Frequency'],
+                                    matrix['Data'][row], date, time)
+        self.file.seek(end)
+        buffer[2] = row + 1
+        buffer[3] = end
+        return self.last_frame
+
+    def get_shared_frequency(self, frequency):
+        """
+        :param frequency: list: frequency axis of a frame
+        :return: numpy.ndarray: read-only frequency axis, the same object as long as the frequencies do not change
+        """
+        self.frequency = FSVRFrame.get_shared_frequency(frequency, self.frequency)
+        return self.frequency
+
+    def read_block(self, count, dtype=np.float64, readline=None):
+        """
+        Reads next frames into a level matrix, the frequency axis is stored only once.
+        Frames of the file are converted by the mmap backend, see read_mapped_block(),
+        unless the text backend is set or another source of lines is given
+        :param count: int: number of frames to read
+        :param dtype: numpy dtype of the level matrix
+        :param readline: function: source of lines, read_line() if None
+        :return: dict: frame matrix {'Frequency': array of frequencies, 'Data': frames x values array of levels,
+                 'Timestamp': array of timestamps, 'Frame': array of frame numbers}
+        """
+        if self.file is None:
+            raise RuntimeError("File has not been initialized")
+        if len(self.header) == 0:
+            raise RuntimeError("Header has not been initialized")
+        if readline is None and self.backend == 'mmap':
+            return self.read_mapped_block(count, dtype)
+        if readline is None:
+            readline = self.read_line
+        values = int(self.header['Values'][0])
+        frequency = np.empty(0)
+        levels = np.empty((count, values), dtype=dtype)
+        dates = []
+        times = []
+        frames = np.empty(count, dtype=np.int64)
+        read = 0
+        read_time = 0.0
+        convert_time = 0.0
+        bytes_read = 0
+        while read < count:
+            start = perf_counter()
+            frame_line = readline()
+            timestamp_line = readline()
+            block = [readline() for i in range(values)]
+            read_end = perf_counter()
+            read_time += read_end - start
+            # stop on the end of file or on an incomplete frame
+            if not block or not block[-1]:
+                break
+            bytes_read += len(frame_line) + len(timestamp_line) + sum(map(len, block))
+            frames[read] = int(frame_line.rstrip().split(";")[1])
+            date, time = timestamp_line.rstrip().split(";")[1:3]
+            dates.append(date)
+            times.append(time)
+            # convert the whole frame at once, lines are freq;level;
+            data = np.array("".join(block).replace(";", " ").split(), dtype=np.float64).reshape(values, 2)
+            if read == 0:
+                frequency = data[:, 0]
+            levels[read] = data[:, 1]
+            read += 1
+            convert_time += perf_counter() - read_end
+        with self.profiler.stage('decode_timestamps'):
+            timestamps = self.parse_timestamps(dates, times)
+        self.profiler.add_time('read_lines', read_time)
+        self.profiler.add_time('convert_values', convert_time)
+        self.profiler.count('lines_read', read * (values + 2))
+        self.profiler.count('bytes_read', bytes_read)
+        self.profiler.count('frames_decoded', read)
+        if read > 0:
+            frequency = self.get_shared_frequency(frequency)
+            self.last_frame = FSVRFrame(frames[read-1], timestamps[read-1], frequency, data[:, 1].copy(), date, time)
+        return {'Frequency': frequency, 'Data': levels[:read], 'Timestamp': timestamps, 'Frame': frames[:read]}
+
+    def read_mapped_block(self, count, dtype=np.float64, offsets=None, records=None):
+        """
+        Reads next frames of the memory-mapped file, Frame and Timestamp lines are taken as fixed position
+        records, value lines of many frames are converted at once by parse_numbers().
+        The frequency column is converted only until the frequency axis of the file is known
+        :param count: int: number of frames to read
+        :param dtype: numpy dtype of the level matrix
+        :param offsets: list: byte offsets of the frames to read instead of the frames after the file pointer
+        :param records: list: receives (byte offset after the frame, date, time) of every read frame
+        :return: dict: frame matrix, see read_block()
+        """
+        values = int(self.header['Values'][0])
+        offset = first = self.file.tell() if offsets is None else int(offsets[0]) if len(offsets) > 0 else 0
+        if offsets is not None:
+            count = min(count, len(offsets))
+        # the decompressed size of a compressed file is known only at its end, a file map is refreshed
+        # when the file has grown since it was mapped
+        if count <= 0 or self.compression is None and offset >= len(self.get_mapping()) and \
+                offset >= len(self.get_mapping(True)):
+            return {'Frequency': np.empty(0), 'Data': np.empty((0, values), dtype=dtype),
+                    'Timestamp': np.empty(0), 'Frame': np.empty(0, dtype=np.int64)}
+        known = self.frequency is not None and len(self.frequency) == values
+        frequency = self.frequency if known else np.empty(0)
+        refreshed = False
+        levels = np.empty((count, values), dtype=dtype)
+        frame_lines = []
+        dates = []
+        times = []
+        read = 0
+        map_time = 0.0
+        convert_time = 0.0
+        while read < count:
+            start = perf_counter()
+            blocks = []
+            with self.map_file(offset) as mm:
+                while read + len(blocks) < count and len(blocks) < self.mapped_frames:
+                    if offsets is not None:
+                        offset = int(offsets[read + len(blocks)])
+                    frame_end = mm.find(b"\n", offset)
+                    timestamp_end = mm.find(b"\n", frame_end + 1) if frame_end >= 0 else -1
+                    if timestamp_end < 0:
+                        break
+                    values_end = self.find_values_end(mm, timestamp_end + 1, values)
+                    if values_end < 0:
+                        break
+                    frame_lines.append(mm[offset:frame_end].decode())
+                    date, time = mm[frame_end+1:timestamp_end].decode().rstrip().split(";")[1:3]
+                    dates.append(date)
+                    times.append(time)
+                    blocks.append(mm[timestamp_end+1:values_end])
+                    offset = values_end
+                    if records is not None:
+                        records.append((values_end, date, time))
+            converted = perf_counter()
+            map_time += converted - start
+            if len(blocks) == 0:
+                # the last frame may be complete in the file if it has grown since it was mapped
+                if self.compression is None and not refreshed:
+                    refreshed = True
+                    size = len(self.get_mapping())
+                    if len(self.get_mapping(True)) != size:
+                        continue
+                break
+            data = self.parse_value_lines(b"".join(blocks), len(blocks) * values, read == 0 and not known)
+            if read == 0 and not known:
+                frequency = data[0][:values]
+            levels[read:read + len(blocks)] = data[1].reshape(len(blocks), values)
+            last_levels = data[1][-values:]
+            read += len(blocks)
+            convert_time += perf_counter() - converted
+        self.file.seek(offset)
+        frames = np.array([int(line.rstrip().split(";")[1]) for line in frame_lines], dtype=np.int64)
+        with self.profiler.stage('decode_timestamps'):
+            timestamps = self.parse_timestamps(dates, times)
+        self.profiler.add_time('map_frames', map_time)
+        self.profiler.add_time('convert_values', convert_time)
+        self.profiler.count('lines_read', read * (values + 2))
+        self.profiler.count('bytes_read', offset - first)
+        self.profiler.count('frames_decoded', read)
+        if read > 0:
+            frequency = self.get_shared_frequency(frequency)
+            self.last_frame = FSVRFrame(frames[-1], timestamps[-1], frequency, last_levels.copy(), dates[-1], times[-1])
+        return {'Frequency': frequency, 'Data': levels[:read], 'Timestamp': timestamps, 'Frame': frames}
+
+    @contextmanager
+    def map_file(self, offset):
+        """
+        Maps the file for reading frames from an offset, compressed files are viewed through their
+        decompressed stream, which keeps the data from the offset while the view is used
+        :param offset: int: first byte read through the map
+        :return: mmap.mmap or FSVRCompressedMap: object with find() and slicing by absolute offsets
+        """
+        if self.compression is not None:
+            yield FSVRCompressedMap(self.file.buffer.raw, offset)
+            return
+        yield self.get_mapping()
+
+    @staticmethod
+    def find_values_end(mm, start, values):
+        """
+        :param mm: mmap.mmap: memory-mapped file, see map_file()
+        :param start: int: byte offset of the first value line of a frame
+        :param values: int: number of value lines
+        :return: int: byte offset after the last value line, -1 if the frame is incomplete
+        """
+        # the next frame header usually marks the end, otherwise value lines are counted
+        end = mm.find(b"\nFrame;", start)
+        end = end + 1 if end >= 0 else len(mm)
+        lines = mm[start:end]
+        if lines.count(b"\n") == values and lines.endswith(b"\n"):
+            return end
+        newlines = np.flatnonzero(np.frombuffer(lines, dtype=np.uint8) == ord("\n"))
+        if len(newlines) >= values:
+            return start + int(newlines[values - 1]) + 1
+        # the last line of the file may have no line break
+        if end == len(mm) and len(newlines) == values - 1 and len(lines) > (newlines[-1] + 1 if values > 1 else 0):
+            return end
+        return -1
+
+    @classmethod
+    def parse_value_lines(cls, text, lines, frequencies=True):
+        """
+        Converts freq;level; lines at once
+        :param text: bytes: value lines
+        :param lines: int: number of lines
+        :param frequencies: bool: convert the frequency column too
+        :return: numpy.ndarray: frequencies, empty if not converted
+                 numpy.ndarray: levels
+        """
+        chars = np.frombuffer(text, dtype=np.uint8)
+        semicolons = np.flatnonzero(chars == ord(";"))
+        if len(semicolons) != 2 * lines:
+            # other line layouts are split on whitespace the same way as the text backend does
+            data = np.array(text.decode().replace(";", " ").split(), dtype=np.float64).reshape(lines, 2)
+            return data[:, 0], data[:, 1]
+        levels = cls.parse_numbers(chars, semicolons[0::2] + 1, semicolons[1::2])
+        if not frequencies:
+            return np.empty(0), levels
+        line_starts = np.concatenate(([0], np.flatnonzero(chars[:semicolons[-1]] == ord("\n")) + 1))
+        return cls.parse_numbers(chars, line_starts, semicolons[0::2]), levels
+
+    @classmethod
+    def parse_numbers(cls, chars, starts, ends):
+        """
+        Converts decimal numbers of a text at once. Characters of the numbers are gathered into a
+        columns x numbers matrix, digits are accumulated column by column into integer mantissas which are
+        divided by powers of ten. The result equals float() as long as the division is rounded once,
+        other numbers, e.g. with exponents or more than 18 digits, are converted by float()
+        :param chars: numpy.ndarray: uint8 characters of the text
+        :param starts: numpy.ndarray: offsets of the first characters of the numbers
+        :param ends: numpy.ndarray: offsets after the last characters of the numbers
+        :return: numpy.ndarray: float64 numbers
+        """
+        count = len(starts)
+        if count == 0:
+            return np.empty(0)
+        lengths = ends - starts
+        width = max(int(lengths.max()), 1)
+        # padding keeps the reads of the last columns inside the array
+        chars = np.concatenate((chars, np.zeros(width, dtype=np.uint8)))
+        columns = np.arange(width, dtype=starts.dtype)[:, None]
+        matrix = chars[starts + columns]
+        inside = columns < lengths
+        digits = matrix - np.uint8(ord("0"))
+        is_digit = (digits < 10) & inside
+        is_dot = (matrix == ord(".")) & inside
+        digits *= is_digit
+        multipliers = np.uint8(1) + np.uint8(9) * is_digit.view(np.uint8)
+        mantissa = np.zeros(count, dtype=np.int64)
+        for j in range(width):
+            mantissa *= multipliers[j]
+            mantissa += digits[j]
+        negative = matrix[0] == ord("-")
+        signed = negative | (matrix[0] == ord("+"))
+        dots = is_dot.sum(axis=0)
+        # all characters after the dot are digits unless the number is converted by float()
+        decimals = np.where(dots > 0, lengths - 1 - is_dot.argmax(axis=0), 0)
+        digit_count = lengths - (dots > 0) - signed
+        invalid = inside & ~is_digit & ~is_dot
+        invalid[0] &= ~signed
+        other = invalid.any(axis=0) | (dots > 1) | (digit_count <= 0) | (digit_count > 18)
+        result = mantissa / cls.powers_of_ten[np.where(other, 0, decimals)]
+        large = ~other & (mantissa > 2 ** 53)
+        if large.any() and np.finfo(np.longdouble).nmant >= 63:
+            # 17 digit mantissas are exact in extended precision, the quotient is rounded twice
+            # which can differ from float() only if it falls exactly between two doubles
+            quotient = mantissa[large].astype(np.longdouble) / cls.powers_of_ten[decimals[large]].astype(np.longdouble)
+            rounded = quotient.astype(np.float64)
+            remainder = np.abs(quotient - rounded.astype(np.longdouble))
+            spacing = np.spacing(np.abs(rounded)).astype(np.longdouble)
+            result[large] = rounded
+            other[np.flatnonzero(large)[(remainder == spacing / 2) | (remainder == spacing / 4)]] = True
+        else:
+            other |= large
+        np.negative(result, out=result, where=negative)
+        for i in np.flatnonzero(other).tolist():
+            result[i] = float(chars[starts[i]:ends[i]].tobytes())
+        return result
+
+    def read_matrix(self, start=0, stop=None, dtype=np.float64):
+        """
+        Reads a range of frames from the beginning of the file into a level matrix,
+        the lock is held while reading, so threads sharing the reader do not move each other's file pointer
+        :param start: int: index of the first frame to read
+        :param stop: int: index after the last frame to read, all frames if None
+        :param dtype: numpy dtype of the level matrix
+        :return: dict: frame matrix, see read_block()
+        """
+        total = self.get_data_frames_amount()
+        if stop is None or stop > total:
+            stop = total
+        start = max(start, 0)
+        stop = max(stop, start)
+        with self.lock:
+            if self.use_sidecar:
+                return self.read_sidecar_matrix(start, stop, dtype)
+            return self.parse_matrix(start, stop, dtype)
+
+    def parse_matrix(self, start, stop, dtype=np.float64):
+        """
+        Parses a range of frames of the text file, in parallel if more than one process is set
+        :param start: int: index of the first frame to read
+        :param stop: int: index after the last frame to read
+        :param dtype: numpy dtype of the level matrix
+        :return: dict: frame matrix, see read_block()
+        """
+        # workers seek in the file, compressed files are decompressed once in this process instead
+        if self.processes is not None and self.processes > 1 and stop - start >= 2 * self.min_chunk_frames \
+                and self.compression is None:
+            return self.read_matrix_parallel(start, stop, self.processes, dtype)
+        # start from the 0 frame
+        self.reopen_file()
+        if self.index is not None:
+            self.seek_frame(start)
+        else:
+            # skip frames before the range without converting them
+            with self.profiler.stage('skip_lines'):
+                for i in range(start * (int(self.header['Values'][0]) + 2)):
+                    self.read_line()
+            self.profiler.count('lines_skipped', start * (int(self.header['Values'][0]) + 2))
+        return self.read_block(stop - start, dtype)
+
+    def read_sidecar_matrix(self, start, stop, dtype=np.float64):
+        """
+        Reads a range of frames from the binary sidecar, a cold read parses the whole file
+        and creates the sidecar
+        :param start: int: index of the first frame to read
+        :param stop: int: index after the last frame to read
+        :param dtype: numpy dtype of the level matrix
+        :return: dict: frame matrix, see read_block()
+        """
+        if self.sidecar is None:
+            matrix = self.parse_matrix(0, self.get_data_frames_amount())
+            try:
+                with self.profiler.stage('save_sidecar'):
+                    self.save_sidecar(matrix)
+                self.sidecar = self.load_sidecar()
+            except OSError:
+                self.sidecar = None
+            # keep working from memory if the sidecar can not be written
+            if self.sidecar is None:
+                self.sidecar = matrix
+        matrix = {'Frequency': self.sidecar['Frequency'],
+                  'Data': self.sidecar['Data'][start:stop].astype(dtype, copy=False),
+                  'Timestamp': self.sidecar['Timestamp'][start:stop], 'Frame': self.sidecar['Frame'][start:stop]}
+        self.update_last_frame(matrix)
+        return matrix
+
+    def update_last_frame(self, matrix):
+        """
+        Sets the last frame from the last row of a frame matrix
+        :param matrix: dict: frame matrix, see read_block()
+        :return: 
+        """
+        if len(matrix['Frame']) > 0:
+            self.last_frame = FSVRFrame.from_matrix(matrix, -1, self.get_shared_frequency(matrix['Frequency']))
+
+    def read_matrix_parallel(self, start, stop, processes, dtype=np.float64):
+        """
+        Parses a range of frames in a process pool, the file is split on frame boundaries taken
+        from the frame index and levels are written by the workers directly into shared memory
+        :param start: int: index of the first frame to read
+        :param stop: int: index after the last frame to read
+        :param processes: int: number of worker processes
+        :param dtype: numpy dtype of the level matrix
+        :return: dict: frame matrix, see read_block()
+        """
+        offsets = self.get_index()['Offset']
+        stop = min(stop, len(offsets))
+        start = min(start, stop)
+        count = stop - start
+        values = int(self.header['Values'][0])
+        dtype = np.dtype(dtype)
+        # several chunks per process to balance the load
+        chunk = max(self.min_chunk_frames, -(-count // (processes * 4)))
+        shm = shared_memory.SharedMemory(create=True, size=max(count * values * dtype.itemsize, 1))
+        try:
+            tasks = [(self.file_path, int(offsets[i]), min(chunk, stop - i), shm.name, (count, values), dtype.str,
+                      i - start) for i in range(start, stop, chunk)]
+            with self.profiler.stage('parallel_parse'), ProcessPoolExecutor(processes) as pool:
+                results = list(pool.map(FSVRReader.parse_chunk, tasks))
+            rows = sum(len(result[3]) for result in results)
+            shared_levels = np.ndarray((count, values), dtype=dtype, buffer=shm.buf)
+            levels = shared_levels[:rows].copy()
+            del shared_levels
+        finally:
+            shm.close()
+            shm.unlink()
+        matrix = {'Frequency': results[0][1] if len(results) > 0 else np.empty(0), 'Data': levels,
+                  'Timestamp': np.concatenate([result[2] for result in results]) if rows > 0 else np.empty(0),
+                  'Frame': np.concatenate([result[3] for result in results]) if rows > 0
+                  else np.empty(0, dtype=np.int64)}
+        self.profiler.count('frames_decoded', rows)
+        self.update_last_frame(matrix)
+        return matrix
+
+    @staticmethod
+    def parse_chunk(task):
+        """
+        Worker of read_matrix_parallel(), parses a chunk of frames into the shared level matrix
+        :param task: tuple: (file path, byte offset, number of frames, shared memory name, matrix shape,
+                     dtype, first row)
+        :return: tuple: (first row, frequencies, timestamps, frame numbers)
+        """
+        file_path, offset, count, shm_name, shape, dtype, row = task
+        reader = FSVRReader(file_path)
+        reader.file.seek(offset)
+        block = reader.read_block(count, dtype)
+        reader.close()
+        shm = shared_memory.SharedMemory(name=shm_name)
+        try:
+            shared_levels = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            shared_levels[row:row + len(block['Data'])] = block['Data']
+            del shared_levels
+        finally:
+            shm.close()
+        return row, block['Frequency'], block['Timestamp'], block['Frame']
+
+    def get_index_path(self):
+        """
+        :return: string: path to the persisted frame index
+        """
+        return self.file_path + ".idx.npz"
+
+    def build_index(self):
+        """
+        Scans the file for frame boundaries without converting values
+        :return: dict: frame index {'Offset': byte offsets, 'Frame': frame numbers, 'Timestamp': timestamps},
+                 read_time_window() adds the time order of the frames, 'Order' and 'SortedTimestamp'
+        """
+        if self.file is None:
+            raise RuntimeError("File has not been initialized")
+        if len(self.header) == 0:
+            raise RuntimeError("Header has not been initialized")
+        signature = self.get_file_signature()
+        if self.compression is not None:
+            return self.build_stream_index(signature)
+        offsets = []
+        frames = []
+        dates = []
+        times = []
+        with open(self.file_path, "rb") as fin:
+            if signature[0] > self.header_end:
+                with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    pos = mm.find(b"Frame;", self.header_end)
+                    while pos >= 0:
+                        frame_end = mm.find(b"\n", pos)
+                        timestamp_end = mm.find(b"\n", frame_end + 1)
+                        if frame_end < 0 or timestamp_end < 0:
+                            break
+                        date, time = mm[frame_end+1:timestamp_end].decode().rstrip().split(";")[1:3]
+                        offsets.append(pos)
+                        frames.append(int(mm[pos:frame_end].decode().rstrip().split(";")[1]))
+                        dates.append(date)
+                        times.append(time)
+                        pos = mm.find(b"Frame;", timestamp_end)
+        return {'Offset': np.array(offsets, dtype=np.int64), 'Frame': np.array(frames, dtype=np.int64),
+                'Timestamp': self.parse_timestamps(dates, times), 'Signature': signature}
+
+    def build_stream_index(self, signature, chunk_size=1 << 20):
+        """
+        Scans the decompressed stream of a compressed file for frame boundaries chunk by chunk,
+        the file pointer is restored afterwards
+        :param signature: tuple: signature of the file stored in the index
+        :param chunk_size: int: number of decompressed bytes scanned at once
+        :return: dict: frame index, see build_index()
+        """
+        offsets = []
+        frames = []
+        dates = []
+        times = []
+        position = self.file.tell()
+        buffer = self.file.buffer
+        buffer.seek(self.header_end)
+        base = self.header_end
+        window = b""
+        pos = 0
+        while True:
+            chunk = buffer.read(chunk_size)
+            window = window[pos:] + chunk
+            base += pos
+            pos = 0
+            while True:
+                found = window.find(b"Frame;", pos)
+                if found < 0:
+                    # keep a Frame line split between chunks
+                    pos = max(len(window) - len(b"Frame;"), pos)
+                    break
+                frame_end = window.find(b"\n", found)
+                timestamp_end = window.find(b"\n", frame_end + 1) if frame_end >= 0 else -1
+                if timestamp_end < 0:
+                    pos = found
+                    break
+                date, time = window[frame_end+1:timestamp_end].decode().rstrip().split(";")[1:3]
+                offsets.append(base + found)
+                frames.append(int(window[found:frame_end].decode().rstrip().split(";")[1]))
+                dates.append(date)
+                times.append(time)
+                pos = timestamp_end
+            if not chunk:
+                break
+        self.file.seek(position)
+        return {'Offset': np.array(offsets, dtype=np.int64), 'Frame': np.array(frames, dtype=np.int64),
+                'Timestamp': self.parse_timestamps(dates, times), 'Signature': signature}
+
+    def load_index(self):
+        """
+        Loads persisted frame index if it is up to date with the dat file
+        :return: dict: frame index, see build_index(), None if there is no valid index
+        """
+        if not os.path.isfile(self.get_index_path()):
+            return None
+        try:
+            with np.load(self.get_index_path()) as data:
+                index = {'Offset': data['Offset'], 'Frame': data['Frame'], 'Timestamp': data['Timestamp'],
+                         'Signature': tuple(data['Signature'].tolist())}
+        except (OSError, ValueError, KeyError):
+            return None
+        if index['Signature'] != self.get_file_signature():
+            return None
+        return index
+
+    def save_index(self, index):
+        """
+        Persists frame index next to the dat file
+        :param index: dict: frame index, see build_index()
+        :return: 
+        """
+        with open(self.get_index_path() + ".tmp", "wb") as fout:
+            np.savez(fout, Offset=index['Offset'], Frame=index['Frame'], Timestamp=index['Timestamp'],
+                     Signature=np.array(index['Signature'], dtype=np.int64))
+        os.replace(self.get_index_path() + ".tmp", self.get_index_path())
+
+    def get_index(self):
+        """
+        Returns frame index, loads the persisted one or builds and persists a new one
+        :return: dict: frame index, see build_index()
+        """
+        with self.lock:
+            if self.index is None:
+                self.index = self.load_index()
+            if self.index is None:
+                with self.profiler.stage('build_index'):
+                    self.index = self.build_index()
+                if self.persist_index:
+                    try:
+                        self.save_index(self.index)
+                    except OSError:
+                        pass
+            return self.index
 
-        return frame
+    def seek_frame(self, n):
+        """
+        Moves the file pointer to the n-th frame of the file, next read_frame() reads it
+        :param n: int: frame position in the file starting from 0
+        :return: object: File object
+        """
+        offsets = self.get_index()['Offset']
+        if not 0 <= n <= len(offsets):
+            raise IndexError("Frame " + str(n) + " is out of range")
+        # position after the last frame is the end of file
+        if n < len(offsets):
+            self.file.seek(offsets[n])
+        else:
+            self.file.seek(0, io.SEEK_END)
+        return self.file
+
+    def read_positions(self, positions, dtype=np.float64):
+        """
+        Reads frames at the given positions into a level matrix, consecutive frames are read in one run
+        :param positions: list: sorted frame positions in the file
+        :param dtype: numpy dtype of the level matrix
+        :return: dict: frame matrix, see read_block()
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        if self.backend == 'mmap' and self.compression is None:
+            # frames are found in the map by their offsets and converted together
+            with self.lock:
+                return self.read_mapped_block(len(positions), dtype, self.get_index()['Offset'][positions])
+        blocks = []
+        # split positions into runs of consecutive frames
+        runs = np.split(positions, np.flatnonzero(np.diff(positions) != 1) + 1) if len(positions) > 0 else []
+        with self.lock:
+            for run in runs:
+                self.seek_frame(int(run[0]))
+                blocks.append(self.read_block(len(run), dtype))
+        if len(blocks) == 0:
+            values = int(self.header['Values'][0])
+            return {'Frequency': np.empty(0), 'Data': np.empty((0, values), dtype=dtype),
+                    'Timestamp': np.empty(0), 'Frame': np.empty(0, dtype=np.int64)}
+        return {'Frequency': blocks[0]['Frequency'],
+                'Data': np.concatenate([block['Data'] for block in blocks]),
+                'Timestamp': np.concatenate([block['Timestamp'] for block in blocks]),
+                'Frame': np.concatenate([block['Frame'] for block in blocks])}
+
+    def read_frames(self, start=0, stop=None, step=1, dtype=np.float64):
+        """
+        Reads every step-th frame from start to stop using the frame index
+        :param start: int: position of the first frame
+        :param stop: int: position after the last frame, all frames if None
+        :param step: int: distance between read frames
+        :param dtype: numpy dtype of the level matrix
+        :return: dict: frame matrix, see read_block()
+        """
+        return self.read_positions(range(*slice(start, stop, step).indices(len(self.get_index()['Offset']))), dtype)
+
+    def read_time_window(self, t0, t1, dtype=np.float64):
+        """
+        Reads frames with timestamps between t0 and t1 inclusive, frames are found by a binary search
+        :param t0: float or datetime: start of the window
+        :param t1: float or datetime: end of the window
+        :param dtype: numpy dtype of the level matrix
+        :return: dict: frame matrix in the file order, see read_block()
+        """
+        if isinstance(t0, datetime.datetime):
+            t0 = t0.timestamp()
+        if isinstance(t1, datetime.datetime):
+            t1 = t1.timestamp()
+        with self.lock:
+            index = self.get_index()
+            if 'Order' not in index:
+                # the time order is kept with the index, frames are usually stored from the newest
+                # to the oldest one, so it is the reversed file order and is not sorted
+                timestamps = index['Timestamp']
+                if np.all(timestamps[1:] <= timestamps[:-1]):
+                    index['Order'] = np.arange(len(timestamps) - 1, -1, -1)
+                else:
+                    index['Order'] = np.argsort(timestamps, kind='stable')
+                index['SortedTimestamp'] = timestamps[index['Order']]
+        lo = np.searchsorted(index['SortedTimestamp'], t0, side='left')
+        hi = np.searchsorted(index['SortedTimestamp'], t1, side='right')
+        return self.read_positions(np.sort(index['Order'][lo:hi]), dtype)
+
+    def skip_frames(self, count):
+        """
+        Moves the file pointer over the next frames without converting them, the text backend reads
+        Values+2 lines per frame, the mmap backend looks for the next Frame lines
+        :param count: int: number of frames to skip
+        :return: int: number of frames skipped, less than count at the end of file
+        """
+        if self.file is None:
+            raise RuntimeError("File has not been initialized")
+        if len(self.header) == 0:
+            raise RuntimeError("Header has not been initialized")
+        values = int(self.header['Values'][0])
+        skipped = 0
+        # compressed files are not mapped as a whole, they are skipped line by line
+        if self.backend != 'mmap' or self.compression is not None:
+            while skipped < count:
+                lines = [self.read_line() for i in range(values + 2)]
+                if not lines[-1]:
+                    break
+                skipped += 1
+            self.profiler.count('frames_skipped', skipped)
+            return skipped
+        offset = self.file.tell()
+        if count <= 0 or offset >= len(self.get_mapping()) and offset >= len(self.get_mapping(True)):
+            return 0
+        with self.map_file(offset) as mm:
+            while skipped < count:
+                next_frame = mm.find(b"\nFrame;", offset)
+                if next_frame < 0:
+                    # the last frame is passed only if it is complete
+                    frame_end = mm.find(b"\n", offset)
+                    timestamp_end = mm.find(b"\n", frame_end + 1) if frame_end >= 0 else -1
+                    end = self.find_values_end(mm, timestamp_end + 1, values) if timestamp_end >= 0 else -1
+                    if end >= 0:
+                        offset = end
+                        skipped += 1
+                    break
+                offset = next_frame + 1
+                skipped += 1
+        self.file.seek(offset)
+        self.profiler.count('frames_skipped', skipped)
+        return skipped
+
+    def iter_frames(self, start=0, stop=None, step=1, fields=None, dtype=np.float64):
+        """
+        Yields frames lazily from start to stop taking every step-th frame. Frames in between are passed
+        without converting their values, see skip_frames(), or seeked over if the frame index is loaded.
+        The mmap backend takes the offsets of the yielded frames from a loaded or saved frame index or skips
+        to them on the file map, and converts them in blocks of mapped_frames.
+        Without 'Data' in the fields the frames are taken from the frame index and no values are read.
+        The iteration moves the file pointer, other reads of the reader should not be mixed with it
+        :param start: int: position of the first frame
+        :param stop: int: position after the last frame, all frames if None
+        :param step: int: distance between yielded frames
+        :param fields: list: fields of the yielded frames, 'Frame' and 'Timestamp' are always set,
+                       levels only with 'Data', all if None
+        :param dtype: numpy dtype of the levels
+        :return: generator: FSVRFrame frames
+        """
+        if step < 1:
+            raise ValueError("Step must be a positive number")
+        start = max(start, 0)
+        if fields is not None and 'Data' not in fields:
+            index = self.get_index()
+            for i in range(*slice(start, stop, step).indices(len(index['Offset']))):
+                yield FSVRFrame(index['Frame'][i], index['Timestamp'][i], self.frequency, None)
+            return
+        if stop is None:
+            stop = self.get_data_frames_amount()
+        self.reopen_file()
+        if self.index is None and self.skip_frames(start) < start:
+            return
+        position = start
+        if step > 1 and self.backend == 'mmap' and self.compression is None:
+            # offsets of the yielded frames are taken from the index, a saved one is loaded, otherwise
+            # they are found by skipping on the file map, the frames are converted in blocks
+            if self.index is None:
+                self.index = self.load_index()
+            while position < stop:
+                offsets = []
+                while position < stop and len(offsets) < self.mapped_frames:
+                    if self.index is not None:
+                        if position >= len(self.index['Offset']):
+                            break
+                        offsets.append(int(self.index['Offset'][position]))
+                    else:
+                        offsets.append(self.file.tell())
+                        # the yielded frame and the frames up to the next one are passed
+                        gap = min(step, stop - position)
+                        if self.skip_frames(gap) < gap:
+                            position = stop
+                            break
+                    position += step
+                if len(offsets) == 0:
+                    return
+                next_offset = self.file.tell()
+                block = self.read_mapped_block(len(offsets), dtype, offsets)
+                self.file.seek(next_offset)
+                for i in range(len(block['Frame'])):
+                    yield FSVRFrame.from_matrix(block, i)
+                if len(block['Frame']) < len(offsets):
+                    return
+            return
+        while position < stop:
+            if self.index is not None:
+                if position >= len(self.index['Offset']):
+                    return
+                self.seek_frame(position)
+            block = self.read_block(min(self.mapped_frames, stop - position) if step == 1 else 1, dtype)
+            if len(block['Frame']) == 0:
+                return
+            for i in range(len(block['Frame'])):
+                yield FSVRFrame.from_matrix(block, i)
+            position += len(block['Frame'])
+            skip = min(step - 1, stop - position)
+            if skip > 0 and self.index is None and self.skip_frames(skip) < skip:
+                return
+            position += max(skip, 0)
+
+    def follow_blocks(self, poll_interval=0.2, timeout=None, start=0, dtype=np.float64, max_bytes=1 << 24):
+        """
+        Follows a dat file which is still being written and yields frames as they are appended,
+        partially written frames are held back until all their lines are complete.
+        Frames amount from the header is not used
+        :param poll_interval: float: seconds between checks for new data
+        :param timeout: float: stop after this many seconds without new frames, follow forever if None
+        :param start: int: position of the first frame to yield
+        :param dtype: numpy dtype of the level matrix
+        :param max_bytes: int: maximal number of bytes read at once, a large backlog of appended data
+                          is yielded in blocks of at most this size
+        :return: generator: frame matrices of the newly completed frames, see read_block()
+        """
+        if self.file is None:
+            raise RuntimeError("File has not been initialized")
+        if len(self.header) == 0:
+            raise RuntimeError("Header has not been initialized")
+        if self.compression is not None:
+            raise ValueError("Compressed file " + self.file_path + " can not be followed")
+        lines_per_frame = int(self.header['Values'][0]) + 2
+        position = self.header_end
+        pending = b""
+        skip = start
+        last_frame_time = monotonic()
+        with open(self.file_path, "rb") as fin:
+            while True:
+                if os.path.getsize(self.file_path) < position:
+                    # file was truncated or replaced, earlier frames are no longer valid
+                    return
+                fin.seek(position)
+                data = fin.read(max_bytes)
+                position += len(data)
+                pending += data
+                newlines = np.flatnonzero(np.frombuffer(pending, dtype=np.uint8) == ord("\n"))
+                complete = len(newlines) // lines_per_frame
+                if skip > 0 and complete > 0:
+                    skipped = min(skip, complete)
+                    pending = pending[newlines[skipped * lines_per_frame - 1] + 1:]
+                    newlines = newlines[skipped * lines_per_frame:] - (newlines[skipped * lines_per_frame - 1] + 1)
+                    complete -= skipped
+                    skip -= skipped
+                if complete > 0:
+                    end = newlines[complete * lines_per_frame - 1] + 1
+                    lines = io.StringIO(pending[:end].decode(), newline=None)
+                    pending = pending[end:]
+                    last_frame_time = monotonic()
+                    yield self.read_block(complete, dtype, lines.readline)
+                elif len(data) == max_bytes:
+                    # the rest of the appended data is read without waiting
+                    continue
+                elif timeout is not None and monotonic() - last_frame_time > timeout:
+                    return
+                else:
+                    sleep(poll_interval)
+
+    def follow(self, poll_interval=0.2, timeout=None, start=0):
+        """
+        Follows a dat file which is still being written and yields frames one by one, see follow_blocks()
+        :param poll_interval: float: seconds between checks for new data
+        :param timeout: float: stop after this many seconds without new frames, follow forever if None
+        :param start: int: position of the first frame to yield
+        :return: generator: FSVRFrame frames as returned by read_frame(), sharing one frequency axis
+        """
+        for block in self.follow_blocks(poll_interval, timeout, start):
+            for i in range(len(block['Frame'])):
+                yield FSVRFrame.from_matrix(block, i)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Igor Kim
+E-mail: igor.skh@gmail.com
+Repository: https://bitbucket.org/igorkim/fsvrreader
+
+Running statistics module for R&S FSVR Signal Analyzer DAT files
+
+April 2017
+"""
+import numpy as np
+
+
+class FSVRStatistics:
+    """
+    Running statistics over blocks of data frames, memory does not depend on the number of frames.
+    Keeps per frequency mean and variance (Welford), max-hold and min-hold, per threshold occupancy
+    counters and Markov transitions of the averaged frame levels
+    """
+    thresholds = []  #: list: sorted threshold levels
+    zero_state = False  #: bool: assign Markov state 0 to the values below the lowest threshold
+    frames = 0  #: int: number of accumulated data frames
+    mean = None  #: numpy.ndarray: mean level per frequency
+    m2 = None  #: numpy.ndarray: sum of squared deviations from the mean per frequency
+    max_hold = None  #: numpy.ndarray: maximum level per frequency
+    min_hold = None  #: numpy.ndarray: minimum level per frequency
+    over_threshold = None  #: numpy.ndarray: thresholds x frequencies counts of levels over each threshold
+    frames_over_threshold = None  #: numpy.ndarray: per threshold count of frames averaged over the threshold
+    avg_mean = 0.0  #: float: mean of the averaged frame levels
+    avg_m2 = 0.0  #: float: sum of squared deviations of the averaged frame levels
+    transitions = None  #: numpy.ndarray: Markov transition counts of the averaged frame levels
+    last_state = -1  #: int: Markov state of the last accumulated frame
+    start_ts = None  #: float: smallest timestamp seen
+    end_ts = None  #: float: largest timestamp seen
+
+    def __init__(self, thresholds=None, zero_state=False):
+        """
+        :param thresholds: list: threshold levels
+        :param zero_state: bool: assign Markov state 0 to the values below the lowest threshold
+        """
+        self.thresholds = sorted(thresholds or [])
+        self.zero_state = zero_state
+        self.frames_over_threshold = np.zeros(len(self.thresholds), dtype=np.int64)
+        self.transitions = np.zeros([len(self.thresholds)+1, len(self.thresholds)+1], dtype=int)
+
+    def update(self, levels, timestamps=None):
+        """
+        Adds a block of data frames to the statistics
+        :param levels: numpy.ndarray: frames x values array of levels
+        :param timestamps: list: timestamps of the frames
+        :return:
+        """
+        levels = np.asarray(levels, dtype=np.float64)
+        if levels.ndim != 2 or len(levels) == 0:
+            return
+        n_b = len(levels)
+        mean_b = levels.mean(axis=0)
+        m2_b = ((levels - mean_b) ** 2).sum(axis=0)
+        averages = levels.mean(axis=1)
+        if self.frames == 0:
+            values = levels.shape[1]
+            self.mean = np.zeros(values)
+            self.m2 = np.zeros(values)
+            self.max_hold = np.full(values, -np.inf)
+            self.min_hold = np.full(values, np.inf)
+            self.over_threshold = np.zeros((len(self.thresholds), values), dtype=np.int64)
+        # merge block moments into the running ones (Chan et al. parallel Welford update)
+        n_a = self.frames
+        n = n_a + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / n
+        self.m2 += m2_b + delta ** 2 * n_a * n_b / n
+        avg_mean_b = averages.mean()
+        avg_delta = avg_mean_b - self.avg_mean
+        self.avg_mean += avg_delta * n_b / n
+        self.avg_m2 += ((averages - avg_mean_b) ** 2).sum() + avg_delta ** 2 * n_a * n_b / n
+        self.frames = n
+        np.maximum(self.max_hold, levels.max(axis=0), out=self.max_hold)
+        np.minimum(self.min_hold, levels.min(axis=0), out=self.min_hold)
+        for i, threshold in enumerate(self.thresholds):
+            self.over_threshold[i] += (levels > threshold).sum(axis=0)
+            self.frames_over_threshold[i] += int((averages > threshold).sum())
+        self.update_transitions(averages)
+        if timestamps is not None and len(timestamps) > 0:
+            self.start_ts = min(np.min(timestamps), self.start_ts if self.start_ts is not None else np.inf)
+            self.end_ts = max(np.max(timestamps), self.end_ts if self.end_ts is not None else -np.inf)
+
+    def update_transitions(self, averages):
+        """
+        Adds Markov transitions of averaged frame levels, the chain continues from the last state
+        :param averages: numpy.ndarray: averaged levels of the frames
+        :return:
+        """
+        states = np.searchsorted(np.asarray(self.thresholds, dtype=np.float64), averages, side='left')
+        if not self.zero_state:
+            states = states[states > 0]
+        if len(states) == 0:
+            return
+        if self.last_state >= 0:
+            states = np.concatenate(([self.last_state], states))
+        n_states = len(self.thresholds) + 1
+        codes = states[:-1] * n_states + states[1:]
+        self.transitions += np.bincount(codes, minlength=n_states ** 2).reshape(n_states, n_states)
+        self.last_state = int(states[-1])
+
+    def get_variance(self):
+        """
+        :return: numpy.ndarray: population variance of the levels per frequency
+        """
+        if self.frames == 0:
+            raise RuntimeError("No data frames have been accumulated")
+        return self.m2 / self.frames
+
+    def get_std_dev(self):
+        """
+        :return: numpy.ndarray: population standard deviation of the levels per frequency
+        """
+        return np.sqrt(self.get_variance())
+
+    def get_avg_std_dev(self):
+        """
+        :return: float: mean of the averaged frame levels
+                 float: standard deviation of the averaged frame levels
+        """
+        if self.frames == 0:
+            raise RuntimeError("No data frames have been accumulated")
+        return self.avg_mean, np.sqrt(self.avg_m2 / self.frames)
+
+    def get_occupancy(self):
+        """
+        :return: numpy.ndarray: thresholds x frequencies share of frames with the level over each threshold
+        """
+        if self.frames == 0:
+            raise RuntimeError("No data frames have been accumulated")
+        return self.over_threshold / self.frames
+
+    def get_occupation_ratios(self):
+        """
+        :return: numpy.ndarray: per threshold percentage of frames averaged over the threshold
+        """
+        if self.frames == 0:
+            raise RuntimeError("No data frames have been accumulated")
+        return self.frames_over_threshold * 100 / self.frames
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Igor Kim
+E-mail: igor.skh@gmail.com
+Repository: https://bitbucket.org/igorkim/fsvrreader
+
+Installation script, installs the modules and the fsvr command
+
+April 2017
+"""
+from setuptools import setup
+
+setup(
+    name="fsvrreader",
+    version="0.1",
+    description="Reader and analysis of R&S FSVR Signal Analyzer DAT files",
+    author="Igor Kim",
+    author_email="igor.skh@gmail.com",
+    url="https://bitbucket.org/igorkim/fsvrreader",
+    py_modules=["FSVRReader", "FSVRAnalysis", "FSVRBatch", "FSVRStatistics", "FSVRGenerator", "FSVRBenchmark",
+                "FSVRProfiler", "FSVREvents", "FSVRColumnarReader", "FSVRFrame", "FSVRPyramid", "FSVRCli",
+                "FSVRCompressedFile"],
+    install_requires=["numpy"],
+    # plotting is optional, numeric subcommands do not import matplotlib
+    extras_require={"plot": ["matplotlib"]},
+    entry_points={"console_scripts": ["fsvr = FSVRCli:FSVRCli.main"]},
+)
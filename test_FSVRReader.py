@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Igor Kim
+E-mail: igor.skh@gmail.com
+Repository: https://bitbucket.org/igorkim/fsvrreader
+
+Regression tests of the parsers and compressed input of FSVRReader, run by python -m unittest
+
+April 2017
+"""
+import bz2
+import datetime
+import gzip
+import lzma
+import os
+import tempfile
+import time
+import unittest
+import zlib
+import numpy as np
+from FSVRReader import FSVRReader
+from FSVRCompressedFile import FSVRCompressedFile, FSVRCompressedMap
+from FSVRGenerator import FSVRGenerator
+
+
+class TestParseNumbers(unittest.TestCase):
+    """
+    parse_numbers() must give the same bits as float()
+    """
+
+    @staticmethod
+    def parse(numbers):
+        """
+        :param numbers: list: number strings
+        :return: numpy.ndarray: numbers converted by parse_numbers()
+        """
+        text = ";".join(numbers) + ";"
+        chars = np.frombuffer(text.encode(), dtype=np.uint8)
+        ends = np.flatnonzero(chars == ord(";"))
+        starts = np.concatenate(([0], ends[:-1] + 1))
+        return FSVRReader.parse_numbers(chars, starts, ends)
+
+    def assert_exact(self, numbers):
+        expected = np.array([float(number) for number in numbers], dtype=np.float64)
+        self.assertEqual(self.parse(numbers).view(np.int64).tolist(), expected.view(np.int64).tolist())
+
+    def test_levels_and_frequencies(self):
+        self.assert_exact(["-95.83", "-45.00", "0.01", "2448200000.000000", "2448212500", "-0.0", "0", "7.", ".5"])
+
+    def test_signs(self):
+        self.assert_exact(["+1.5", "-1.5", "+0", "-0", "+.25", "-120.125"])
+
+    def test_exponents(self):
+        self.assert_exact(["1e-3", "-2.5E+07", "2.4482e9", "+6.02e23", "1E0", "-9.99e-300"])
+
+    def test_long_mantissas(self):
+        self.assert_exact(["12345678901234567890.5", "0.1234567890123456789", "9007199254740993",
+                           "-90.071992547409931", "123456789012345678", "0.30000000000000004"])
+
+    def test_random_numbers(self):
+        rng = np.random.default_rng(0)
+        values = rng.standard_normal(2000) * 10.0 ** rng.integers(-8, 12, 2000)
+        self.assert_exact(["%.17g" % value for value in values])
+        self.assert_exact(["%.6f" % value for value in values])
+        self.assert_exact(["%.2f" % value for value in values])
+
+
+class TestParseTimestamps(unittest.TestCase):
+    """
+    Arithmetic timestamp decoding must match strptime() in local time, including daylight saving changes
+    """
+
+    def setUp(self):
+        if not hasattr(time, 'tzset'):
+            self.skipTest("time zone can not be changed on this platform")
+        self.tz = os.environ.get('TZ')
+        os.environ['TZ'] = 'Europe/Berlin'
+        time.tzset()
+        # cached hour timestamps depend on the time zone
+        FSVRReader.hour_timestamps.clear()
+
+    def tearDown(self):
+        if self.tz is None:
+            del os.environ['TZ']
+        else:
+            os.environ['TZ'] = self.tz
+        time.tzset()
+        FSVRReader.hour_timestamps.clear()
+
+    def test_daylight_saving(self):
+        dates = []
+        times = []
+        # last Sundays of March and October 2017, around the changes at 2 and 3 o'clock
+        for date in ("26.Mar 17", "29.Oct 17", "12.Apr 17"):
+            for hour in range(0, 5):
+                for clock in ("00:00.000", "30:15.5", "59:59.999", "59:59.999999", "00:01.47"):
+                    dates.append(date)
+                    times.append("%02d:%s" % (hour, clock))
+        expected = [datetime.datetime.strptime(date + "T" + clock, "%d.%b %yT%H:%M:%S.%f").timestamp()
+                    for date, clock in zip(dates, times)]
+        self.assertEqual([FSVRReader.parse_timestamp(date, clock) for date, clock in zip(dates, times)], expected)
+        # fixed width columns are decoded in bulk
+        for width in (12, 15):
+            selected = [i for i, clock in enumerate(times) if len(clock) == width]
+            result = FSVRReader.parse_timestamps([dates[i] for i in selected], [times[i] for i in selected])
+            self.assertEqual(result.tolist(), [expected[i] for i in selected])
+
+
+class TestBackends(unittest.TestCase):
+    """
+    Both frame parsers read the same frames and stop at the end of the file the same way
+    """
+
+    def test_end_of_file(self):
+        with tempfile.TemporaryDirectory() as folder:
+            filename = FSVRGenerator(frames=5, values=31).write(os.path.join(folder, "frames.DAT"))
+            frames = {}
+            for backend in ('mmap', 'text'):
+                with FSVRReader(filename, backend=backend) as reader:
+                    frames[backend] = [reader.read_frame() for i in range(5)]
+                    self.assertRaises(EOFError, reader.read_frame)
+            for mapped, text in zip(frames['mmap'], frames['text']):
+                self.assertEqual(mapped['Frame'], text['Frame'])
+                self.assertEqual(mapped['Timestamp'], text['Timestamp'])
+                self.assertEqual(mapped['Data'], text['Data'])
+
+
+class TestCompressedFiles(unittest.TestCase):
+    """
+    Compressed files are read the same way as the plain file. Small chunks, checkpoints and lookback
+    make the reads cross many chunk boundaries and restart from checkpoints
+    """
+    #: dict: compressors of the tested formats, gzip2 is a file of two concatenated gzip members
+    compressors = {'gzip': gzip.compress, 'bz2': bz2.compress, 'xz': lzma.compress, 'zlib': zlib.compress,
+                   'gzip2': lambda data: gzip.compress(data[:len(data) // 3]) + gzip.compress(data[len(data) // 3:])}
+
+    def setUp(self):
+        self.settings = {key: getattr(FSVRCompressedFile, key)
+                         for key in ('chunk_size', 'checkpoint_interval', 'lookback')}
+        FSVRCompressedFile.chunk_size = 4096
+        FSVRCompressedFile.checkpoint_interval = 1 << 15
+        FSVRCompressedFile.lookback = 1 << 13
+        self.folder = tempfile.TemporaryDirectory()
+        self.plain = FSVRGenerator(frames=300, values=31, seed=3).write(os.path.join(self.folder.name, "plain.DAT"))
+        with open(self.plain, "rb") as fin:
+            self.data = fin.read()
+        self.files = {}
+        for name, compress in self.compressors.items():
+            self.files[name] = os.path.join(self.folder.name, name + ".DAT")
+            with open(self.files[name], "wb") as fout:
+                fout.write(compress(self.data))
+        with FSVRReader(self.plain) as reader:
+            self.matrix = reader.read_matrix()
+
+    def tearDown(self):
+        for key, value in self.settings.items():
+            setattr(FSVRCompressedFile, key, value)
+        self.folder.cleanup()
+
+    def assert_matrix(self, matrix, rows):
+        self.assertEqual(matrix['Frame'].tolist(), self.matrix['Frame'][rows].tolist())
+        self.assertEqual(matrix['Timestamp'].tolist(), self.matrix['Timestamp'][rows].tolist())
+        self.assertTrue(np.array_equal(matrix['Data'], self.matrix['Data'][rows]))
+
+    def test_detection(self):
+        for name, filename in self.files.items():
+            self.assertEqual(FSVRCompressedFile.get_compression(filename), 'gzip' if name == 'gzip2' else name)
+        self.assertIsNone(FSVRCompressedFile.get_compression(self.plain))
+
+    def test_read_matrix(self):
+        for name, filename in self.files.items():
+            for backend in ('mmap', 'text'):
+                with self.subTest(name=name, backend=backend), FSVRReader(filename, backend=backend) as reader:
+                    self.assert_matrix(reader.read_matrix(), slice(None))
+                    # the stream is rewound and read again
+                    self.assert_matrix(reader.read_matrix(20, 40), slice(20, 40))
+
+    def test_seek_frame(self):
+        rng = np.random.default_rng(0)
+        for name, filename in self.files.items():
+            with self.subTest(name=name), FSVRReader(filename) as reader:
+                # forward and backward seeks, near and far from the current position
+                for position in rng.integers(0, 298, 25).tolist() + [299, 0, 150, 149]:
+                    reader.seek_frame(position)
+                    self.assert_matrix(reader.read_block(2), slice(position, position + 2))
+                reader.seek_frame(300)
+                self.assertRaises(EOFError, reader.read_frame)
+
+    def test_read_time_window(self):
+        timestamps = self.matrix['Timestamp']
+        for name, filename in self.files.items():
+            with self.subTest(name=name), FSVRReader(filename) as reader:
+                for t0, t1 in ((timestamps[200], timestamps[100]), (timestamps[-1], timestamps[0]),
+                               (timestamps[5], timestamps[5])):
+                    rows = np.flatnonzero((timestamps >= t0) & (timestamps <= t1))
+                    self.assert_matrix(reader.read_time_window(t0, t1), rows)
+
+    def test_map_find(self):
+        for name, filename in self.files.items():
+            with self.subTest(name=name):
+                stream = FSVRCompressedFile(filename)
+                try:
+                    for offset in (0, 4090, 20000, len(self.data) - 100):
+                        view = FSVRCompressedMap(stream, offset)
+                        position = offset
+                        # every occurrence from the offset, also those split between two chunks
+                        for i in range(40):
+                            expected = self.data.find(b"\nFrame;", position)
+                            found = view.find(b"\nFrame;", position)
+                            self.assertEqual(found, expected)
+                            if found < 0:
+                                break
+                            self.assertEqual(view[found:found + 7], self.data[found:found + 7])
+                            position = found + 1
+                    # backward seek restarts from a checkpoint
+                    stream.seek(10)
+                    self.assertEqual(stream.read(50), self.data[10:60])
+                    self.assertEqual(stream.get_size(), len(self.data))
+                finally:
+                    stream.close()
+
+
+if __name__ == "__main__":
+    unittest.main()